@@ -0,0 +1,114 @@
+"""Generate synthetic Polar organizations for scaling benchmarks.
+
+A dataset has customers, products (some granting downloadables, some
+license keys), orders spread over the last two years and one license key
+per order of a license product, in the JSON shape fake_polar.py serves.
+Generation is seeded, so the same arguments give the same dataset.
+
+    python bench/dataset.py --orders 50000 --out /tmp/orders-50k.json
+"""
+import argparse
+import json
+import random
+import string
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict
+
+from fake_polar import file_sha256, iso_utc
+
+
+def generate_dataset(orders: int = 1000, customers: int = 0, products: int = 20,
+                     license_product_share: float = 0.3, files_per_product: int = 2,
+                     file_size: int = 256 * 1024, seed: int = 1) -> Dict[str, Any]:
+    """Build a dataset with ``orders`` orders. ``customers`` defaults to a
+    third of the orders, so the average customer has three purchases."""
+    rng = random.Random(seed)
+    customers = customers or max(1, orders // 3)
+    now = datetime.now(timezone.utc)
+    dataset: Dict[str, Any] = {
+        "organization_id": "org_bench",
+        "products": [],
+        "customers": [],
+        "orders": [],
+        "license_keys": [],
+        "files": {},
+    }
+
+    license_benefits = {}  # product_id -> license benefit id
+    for p in range(products):
+        product_id = f"prod_{p}"
+        is_license = p < max(1, round(products * license_product_share))
+        benefit_id = f"benefit_{p}"
+        benefit_type = "license_keys" if is_license else "downloadables"
+        dataset["products"].append({
+            "id": product_id,
+            "name": f"{'App' if is_license else 'Curriculum'} {p}",
+            "benefits": [{"id": benefit_id, "type": benefit_type}],
+            "price_amount": rng.choice((500, 1500, 2900, 4900)),
+        })
+        if is_license:
+            license_benefits[product_id] = benefit_id
+            continue
+        for i in range(files_per_product):
+            file_id = f"file_{len(dataset['files'])}"
+            file_seed = len(dataset["files"]) + 1
+            dataset["files"][file_id] = {
+                "id": file_id, "name": f"curriculum-{p}-{i}.pdf", "size": file_size,
+                "benefit_id": benefit_id, "seed": file_seed,
+                "checksum_sha256": file_sha256(file_seed, file_size),
+            }
+
+    for c in range(customers):
+        dataset["customers"].append({
+            "id": f"cus_{c}", "email": f"customer{c}@bench.test", "name": f"Customer {c}",
+        })
+
+    # Some products sell far better than others
+    weights = [1.0 / (rank + 1) for rank in range(products)]
+    span = timedelta(days=730).total_seconds()
+    created_times = sorted(now - timedelta(seconds=rng.random() * span) for _ in range(orders))
+    for n, created in enumerate(created_times):
+        customer = dataset["customers"][n % customers if n < customers else rng.randrange(customers)]
+        product = rng.choices(dataset["products"], weights)[0]
+        created_at = iso_utc(created)
+        dataset["orders"].append({
+            "id": f"ord_{n}", "customer_id": customer["id"], "product_id": product["id"],
+            "created_at": created_at, "modified_at": created_at,
+        })
+        if product["id"] in license_benefits:
+            key = "-".join("".join(rng.choices(string.ascii_uppercase + string.digits, k=5)) for _ in range(4))
+            dataset["license_keys"].append({
+                "id": f"lk_{len(dataset['license_keys'])}",
+                "key": key,
+                "status": "granted",
+                "customer_id": customer["id"],
+                "customer": {"email": customer["email"], "name": customer["name"]},
+                "benefit_id": license_benefits[product["id"]],
+                "expires_at": None,
+                "limit_activations": 3,
+                "usage": 0,
+                "limit_usage": None,
+                "created_at": created_at,
+                "modified_at": created_at,
+            })
+    return dataset
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=1000)
+    parser.add_argument("--customers", type=int, default=0, help="default: orders / 3")
+    parser.add_argument("--products", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", required=True)
+    args = parser.parse_args()
+
+    dataset = generate_dataset(args.orders, args.customers, args.products, seed=args.seed)
+    with open(args.out, "w") as f:
+        json.dump(dataset, f)
+    print(f"Wrote {len(dataset['orders'])} orders, {len(dataset['customers'])} customers, "
+          f"{len(dataset['license_keys'])} license keys to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""Benchmark /api/download against a local Polar stand-in.
+
+Starts fake_polar.py and the backend (via serve_backend.py) as separate
+processes, then for each mode (single file / multi-file ZIP) and
+concurrency level runs --rounds rounds of concurrent downloads, each by a
+different customer. The backend gets a fresh cache directory per
+concurrency level, so round 1 is cold and later rounds show the warm path.
+
+Reports throughput (MB/s over the round's wall time), time-to-first-byte,
+the backend's peak RSS (VmHWM) and peak disk used under its cache directory.
+
+    python bench/download_bench.py --files 5 --file-size-mb 20 --concurrency 1,4,16
+    python bench/download_bench.py --no-cache --latency-ms 80 --endpoint signed
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+MB = 1024 * 1024
+
+
+def _wait_until_up(url: str, proc: subprocess.Popen, timeout: float = 120.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{url} exited with {proc.returncode}")
+        try:
+            httpx.get(url, timeout=2.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up")
+
+
+def _proc_status_kb(pid: int, field: str) -> Optional[int]:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _reset_peak_rss(pid: int):
+    # Linux: writing 5 to clear_refs resets VmHWM to the current RSS
+    try:
+        with open(f"/proc/{pid}/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _dir_bytes(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+async def _download(client: httpx.AsyncClient, base: str, endpoint: str, product_id: str, email: str,
+                    expected_sha256: Optional[str]) -> Dict[str, Any]:
+    start = time.perf_counter()
+    url, params = f"{base}/api/download", {"product_id": product_id, "email": email}
+    if endpoint == "signed":
+        auth = (await client.get(f"{base}/api/download/authorize", params=params)).json()
+        if not auth.get("success"):
+            return {"ok": False, "error": auth.get("error"), "bytes": 0, "ttfb": None}
+        url, params = base + (auth.get("bundleUrl") or auth["files"][0]["url"]), None
+
+    ttfb = None
+    received = 0
+    digest = hashlib.sha256() if expected_sha256 else None
+    async with client.stream("GET", url, params=params) as resp:
+        async for chunk in resp.aiter_raw():
+            if ttfb is None:
+                ttfb = time.perf_counter() - start
+            received += len(chunk)
+            if digest:
+                digest.update(chunk)
+    ok = resp.status_code == 200 and received > 0
+    if ok and digest and digest.hexdigest() != expected_sha256:
+        return {"ok": False, "error": "checksum mismatch", "bytes": received, "ttfb": ttfb}
+    return {"ok": ok, "error": None if ok else f"HTTP {resp.status_code}", "bytes": received, "ttfb": ttfb}
+
+
+async def _sample_peaks(pid: int, cache_dir: str, peaks: Dict[str, int], stop: asyncio.Event):
+    while not stop.is_set():
+        peaks["disk"] = max(peaks["disk"], await asyncio.to_thread(_dir_bytes, cache_dir))
+        peaks["rss_kb"] = max(peaks["rss_kb"], _proc_status_kb(pid, "VmRSS") or 0)
+        try:
+            await asyncio.wait_for(stop.wait(), 0.1)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def _run_rounds(args, base: str, fake_url: str, backend: subprocess.Popen, cache_dir: str,
+                      mode: str, concurrency: int, dataset: Dict[str, Any]) -> List[Dict[str, Any]]:
+    product_id = "bench-single" if mode == "single" else "bench-multi"
+    expected = None
+    if mode == "single":
+        expected = next(f["checksum_sha256"] for f in dataset["files"].values()
+                        if f["benefit_id"] == f"benefit_{product_id}")
+    rows = []
+    limits = httpx.Limits(max_connections=concurrency * 2, max_keepalive_connections=concurrency * 2)
+    async with httpx.AsyncClient(timeout=httpx.Timeout(600.0), limits=limits) as client:
+        for round_no in range(1, args.rounds + 1):
+            await client.post(f"{fake_url}/_stats/reset")
+            _reset_peak_rss(backend.pid)
+            peaks = {"disk": 0, "rss_kb": 0}
+            stop = asyncio.Event()
+            sampler = asyncio.create_task(_sample_peaks(backend.pid, cache_dir, peaks, stop))
+
+            started = time.perf_counter()
+            results = await asyncio.gather(*[
+                _download(client, base, args.endpoint, product_id, f"customer{i}@bench.test", expected)
+                for i in range(concurrency)
+            ])
+            elapsed = time.perf_counter() - started
+            stop.set()
+            await sampler
+
+            upstream = (await client.get(f"{fake_url}/_stats")).json()
+            total_bytes = sum(r["bytes"] for r in results)
+            ttfbs = [r["ttfb"] for r in results if r["ttfb"] is not None]
+            errors = [r["error"] for r in results if not r["ok"]]
+            rows.append({
+                "mode": mode,
+                "concurrency": concurrency,
+                "round": round_no,
+                "mb": total_bytes / MB,
+                "mb_s": total_bytes / MB / elapsed if elapsed else 0.0,
+                "ttfb_p50_ms": statistics.median(ttfbs) * 1000 if ttfbs else float("nan"),
+                "ttfb_p95_ms": _percentile(ttfbs, 95) * 1000,
+                "peak_rss_mb": max(_proc_status_kb(backend.pid, "VmHWM") or 0, peaks["rss_kb"]) / 1024,
+                "peak_disk_mb": peaks["disk"] / MB,
+                "upstream_mb": upstream.get("file_bytes", 0) / MB,
+                "errors": len(errors),
+            })
+            if errors:
+                print(f"   ⚠️ {len(errors)} failed, e.g. {errors[0]}", file=sys.stderr)
+    return rows
+
+
+def _print_table(rows: List[Dict[str, Any]]):
+    header = (f"{'mode':<7}{'conc':>5}{'round':>6}{'MB':>9}{'MB/s':>9}{'TTFB p50':>10}{'p95':>9}"
+              f"{'RSS MB':>9}{'disk MB':>9}{'up MB':>9}{'err':>5}")
+    print(header)
+    print("-" * len(header))
+    for r in rows:
+        print(f"{r['mode']:<7}{r['concurrency']:>5}{r['round']:>6}{r['mb']:>9.1f}{r['mb_s']:>9.1f}"
+              f"{r['ttfb_p50_ms']:>8.0f}ms{r['ttfb_p95_ms']:>7.0f}ms{r['peak_rss_mb']:>9.1f}"
+              f"{r['peak_disk_mb']:>9.1f}{r['upstream_mb']:>9.1f}{r['errors']:>5}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=5, help="files in the multi-file product")
+    parser.add_argument("--file-size-mb", type=float, default=20)
+    parser.add_argument("--single-file-size-mb", type=float, default=None)
+    parser.add_argument("--latency-ms", type=float, default=0, help="fake Polar latency per request")
+    parser.add_argument("--concurrency", default="1,4,16", help="comma-separated levels")
+    parser.add_argument("--rounds", type=int, default=2, help="rounds per level; round 1 is cold")
+    parser.add_argument("--modes", default="single,multi")
+    parser.add_argument("--endpoint", choices=("download", "signed"), default="download",
+                        help="/api/download, or /api/download/authorize then the signed link")
+    parser.add_argument("--no-cache", action="store_true", help="zero the file and bundle cache budgets")
+    parser.add_argument("--fake-port", type=int, default=8100)
+    parser.add_argument("--port", type=int, default=8200)
+    args = parser.parse_args()
+
+    levels = [int(c) for c in args.concurrency.split(",")]
+    modes = [m.strip() for m in args.modes.split(",")]
+    fake_url = f"http://127.0.0.1:{args.fake_port}"
+    base = f"http://127.0.0.1:{args.port}"
+
+    fake_cmd = [sys.executable, os.path.join(HERE, "fake_polar.py"), "--port", str(args.fake_port),
+                "--customers", str(max(levels)), "--files", str(args.files),
+                "--file-size-mb", str(args.file_size_mb), "--latency-ms", str(args.latency_ms)]
+    if args.single_file_size_mb:
+        fake_cmd += ["--single-file-size-mb", str(args.single_file_size_mb)]
+    fake = subprocess.Popen(fake_cmd)
+    env = dict(os.environ)
+    if args.no_cache:
+        env.update({"FILE_CACHE_MAX_MB": "0", "BUNDLE_CACHE_MAX_MB": "0"})
+
+    rows = []
+    try:
+        _wait_until_up(f"{fake_url}/_stats", fake)
+        dataset = httpx.get(f"{fake_url}/_dataset", timeout=600).json()
+        for concurrency in levels:
+            cache_dir = tempfile.mkdtemp(prefix="bench-cache-")
+            backend = subprocess.Popen([sys.executable, os.path.join(HERE, "serve_backend.py"),
+                                        "--fake-url", fake_url, "--port", str(args.port),
+                                        "--cache-dir", cache_dir], env=env)
+            try:
+                _wait_until_up(f"{base}/", backend)
+                for mode in modes:
+                    print(f"▶ {mode} x{concurrency}", file=sys.stderr)
+                    rows += asyncio.run(_run_rounds(args, base, fake_url, backend, cache_dir,
+                                                    mode, concurrency, dataset))
+            finally:
+                backend.terminate()
+                backend.wait()
+                shutil.rmtree(cache_dir, ignore_errors=True)
+    finally:
+        fake.terminate()
+        fake.wait()
+
+    rows.sort(key=lambda r: (modes.index(r["mode"]), r["concurrency"], r["round"]))
+    _print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
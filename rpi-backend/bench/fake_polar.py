@@ -0,0 +1,347 @@
+"""Local stand-in for the parts of Polar the download path talks to.
+
+Serves, over HTTP:
+  POST /v1/customer-sessions/               -> {"token", "expires_at", ...}
+  GET  /v1/customer-portal/downloadables    -> the session customer's files
+  GET  /v1/customer-portal/license-keys/    -> the session customer's license keys
+  GET  /files/{file_id}                     -> file bodies, with Range support
+  GET  /_dataset, /_stats, POST /_stats/reset
+
+File bodies are generated from a per-file seed, so multi-GB files cost no
+disk, and their SHA-256 matches what the downloadables listing reports.
+Every endpoint waits --latency-ms before answering, like a real round-trip.
+
+The SDK side (customers/orders/products/license_keys .list()) isn't HTTP in
+the backend, so FakePolarSDK mirrors it in-process from the same dataset;
+serve_backend.py installs it in place of polar_sdk.Polar.
+
+    python bench/fake_polar.py --port 8100 --files 5 --file-size-mb 20
+    python bench/fake_polar.py --dataset /tmp/orders-50k.json   # from dataset.py
+"""
+import argparse
+import asyncio
+import hashlib
+import random
+import secrets
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+BLOCK_SIZE = 1024 * 1024  # bodies repeat a random 1 MiB block: incompressible to deflate
+SINGLE_PRODUCT_ID = "bench-single"
+MULTI_PRODUCT_ID = "bench-multi"
+
+
+def iso_utc(dt: datetime) -> str:
+    return dt.astimezone(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def _file_block(seed: int) -> bytes:
+    return random.Random(seed).randbytes(BLOCK_SIZE)
+
+
+def file_sha256(seed: int, size: int) -> str:
+    block = _file_block(seed)
+    digest = hashlib.sha256()
+    remaining = size
+    while remaining > 0:
+        digest.update(block[:min(remaining, BLOCK_SIZE)])
+        remaining -= BLOCK_SIZE
+    return digest.hexdigest()
+
+
+def build_download_dataset(customers: int = 50, files: int = 5, file_size: int = 20 * 1024 * 1024,
+                           single_file_size: Optional[int] = None) -> Dict[str, Any]:
+    """A small organization for download benchmarks: one single-file product,
+    one multi-file product, and ``customers`` customers who bought both."""
+    now = datetime.now(timezone.utc)
+    dataset: Dict[str, Any] = {
+        "organization_id": "org_bench",
+        "products": [],
+        "customers": [],
+        "orders": [],
+        "license_keys": [],
+        "files": {},
+    }
+
+    def add_file(benefit_id: str, name: str, size: int):
+        file_id = f"file_{len(dataset['files'])}"
+        seed = len(dataset["files"]) + 1
+        dataset["files"][file_id] = {
+            "id": file_id, "name": name, "size": size, "benefit_id": benefit_id,
+            "seed": seed, "checksum_sha256": file_sha256(seed, size),
+        }
+
+    for product_id, count, size in ((SINGLE_PRODUCT_ID, 1, single_file_size or file_size),
+                                    (MULTI_PRODUCT_ID, files, file_size)):
+        benefit_id = f"benefit_{product_id}"
+        dataset["products"].append({
+            "id": product_id, "name": product_id.replace("-", " ").title(),
+            "benefits": [{"id": benefit_id, "type": "downloadables"}],
+            "price_amount": 1500,
+        })
+        for i in range(count):
+            add_file(benefit_id, f"{product_id}-{i}.pdf", size)
+
+    for i in range(customers):
+        customer_id = f"cus_{i}"
+        dataset["customers"].append({"id": customer_id, "email": f"customer{i}@bench.test"})
+        for product in dataset["products"]:
+            created = iso_utc(now - timedelta(days=1))
+            dataset["orders"].append({
+                "id": f"ord_{len(dataset['orders'])}", "customer_id": customer_id,
+                "product_id": product["id"], "created_at": created, "modified_at": created,
+            })
+    return dataset
+
+
+# ==================== HTTP SERVER ====================
+
+def create_app(dataset: Dict[str, Any], latency_ms: float = 0.0):
+    from starlette.applications import Starlette
+    from starlette.requests import Request
+    from starlette.responses import JSONResponse, Response, StreamingResponse
+    from starlette.routing import Route
+
+    stats: Counter = Counter()
+    sessions: Dict[str, str] = {}  # token -> customer_id
+    latency = latency_ms / 1000.0
+    customers = {c["id"] for c in dataset["customers"]}
+    benefits_by_product = {p["id"]: {b["id"] for b in p["benefits"]} for p in dataset["products"]}
+    benefits_by_customer: Dict[str, set] = {}
+    for order in dataset["orders"]:
+        benefits_by_customer.setdefault(order["customer_id"], set()).update(
+            benefits_by_product.get(order["product_id"], ()))
+    keys_by_customer: Dict[str, List[Dict[str, Any]]] = {}
+    for key in dataset["license_keys"]:
+        keys_by_customer.setdefault(key["customer_id"], []).append(key)
+    blocks: Dict[int, bytes] = {}
+
+    def session_customer(request: Request) -> Optional[str]:
+        return sessions.get(request.headers.get("authorization", "").removeprefix("Bearer "))
+
+    async def create_session(request: Request):
+        stats["customer_sessions"] += 1
+        await asyncio.sleep(latency)
+        customer_id = (await request.json()).get("customer_id")
+        if customer_id not in customers:
+            return JSONResponse({"detail": "Customer not found"}, status_code=404)
+        token = "polar_cst_" + secrets.token_urlsafe(24)
+        sessions[token] = customer_id
+        expires = datetime.now(timezone.utc) + timedelta(hours=1)
+        return JSONResponse({"token": token, "expires_at": iso_utc(expires), "customer_id": customer_id},
+                            status_code=201)
+
+    async def downloadables(request: Request):
+        stats["downloadables"] += 1
+        await asyncio.sleep(latency)
+        customer_id = session_customer(request)
+        if customer_id is None:
+            return JSONResponse({"detail": "Unauthorized"}, status_code=401)
+        owned = benefits_by_customer.get(customer_id, set())
+        base = str(request.base_url).rstrip("/")
+        expires = iso_utc(datetime.now(timezone.utc) + timedelta(hours=1))
+        items = [{
+            "id": f"dl_{f['id']}",
+            "benefit_id": f["benefit_id"],
+            "file": {
+                "id": f["id"], "name": f["name"], "size": f["size"], "mime_type": "application/pdf",
+                "checksum_sha256_hex": f["checksum_sha256"],
+                "download": {"url": f"{base}/files/{f['id']}", "expires_at": expires},
+            },
+        } for f in dataset["files"].values() if f["benefit_id"] in owned]
+        return JSONResponse({"items": items, "pagination": {"total_count": len(items), "max_page": 1}})
+
+    async def license_keys(request: Request):
+        stats["license_keys"] += 1
+        await asyncio.sleep(latency)
+        customer_id = session_customer(request)
+        if customer_id is None:
+            return JSONResponse({"detail": "Unauthorized"}, status_code=401)
+        keys = keys_by_customer.get(customer_id, [])
+        page = int(request.query_params.get("page", 1))
+        limit = int(request.query_params.get("limit", 10))
+        max_page = max(1, -(-len(keys) // limit))
+        return JSONResponse({"items": keys[(page - 1) * limit:page * limit],
+                             "pagination": {"total_count": len(keys), "max_page": max_page}})
+
+    async def file_body(request: Request):
+        stats["file_requests"] += 1
+        f = dataset["files"].get(request.path_params["file_id"])
+        if f is None:
+            return Response("Not found", status_code=404)
+        size = f["size"]
+        start, end, status = 0, size - 1, 200
+        range_header = request.headers.get("range", "")
+        if range_header.startswith("bytes="):
+            first, _, last = range_header[6:].split(",")[0].partition("-")
+            if first:
+                start, end = int(first), min(int(last), size - 1) if last else size - 1
+            else:
+                start = max(size - int(last), 0)
+            if start > end:
+                return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+            status = 206
+        block = blocks.get(f["seed"])
+        if block is None:
+            block = blocks[f["seed"]] = _file_block(f["seed"])
+        await asyncio.sleep(latency)
+
+        async def body():
+            pos = start
+            # Stop once the client hangs up, so file_bytes counts only what
+            # the backend could actually have read
+            while pos <= end and not await request.is_disconnected():
+                offset = pos % BLOCK_SIZE
+                chunk = block[offset:offset + min(BLOCK_SIZE - offset, end - pos + 1, 256 * 1024)]
+                stats["file_bytes"] += len(chunk)
+                yield chunk
+                pos += len(chunk)
+
+        headers = {"Content-Length": str(end - start + 1), "Accept-Ranges": "bytes",
+                   "ETag": f'"{f["checksum_sha256"][:16]}"'}
+        if status == 206:
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        return StreamingResponse(body(), status_code=status, media_type="application/pdf", headers=headers)
+
+    async def get_dataset(request: Request):
+        return JSONResponse({**dataset, "latency_ms": latency_ms})
+
+    async def get_releases(request: Request):
+        # Stands in for GitHub's releases listing, so the backend's refresh
+        # loop stays local
+        return JSONResponse([])
+
+    async def get_stats(request: Request):
+        return JSONResponse(dict(stats))
+
+    async def reset_stats(request: Request):
+        stats.clear()
+        return JSONResponse({})
+
+    return Starlette(routes=[
+        Route("/v1/customer-sessions/", create_session, methods=["POST"]),
+        Route("/v1/customer-portal/downloadables", downloadables),
+        Route("/v1/customer-portal/downloadables/", downloadables),
+        Route("/v1/customer-portal/license-keys/", license_keys),
+        Route("/files/{file_id}", file_body),
+        Route("/_dataset", get_dataset),
+        Route("/_releases", get_releases),
+        Route("/_stats", get_stats),
+        Route("/_stats/reset", reset_stats, methods=["POST"]),
+    ])
+
+
+# ==================== SDK FACADE ====================
+
+class _Resource:
+    """One SDK resource whose list() pages through dataset rows."""
+
+    def __init__(self, name: str, rows: List[Any], sdk: "FakePolarSDK"):
+        self.name = name
+        self.rows = rows
+        self.sdk = sdk
+
+    def list(self, page: int = 1, limit: Optional[int] = None, **filters):
+        limit = limit or self.sdk.page_size
+        self.sdk.calls[self.name] += 1
+        if self.sdk.latency:
+            time.sleep(self.sdk.latency)
+        rows = self.rows
+        for field in ("customer_id", "product_id", "email"):
+            if filters.get(field) is not None:
+                rows = [r for r in rows if getattr(r, field, None) == filters[field]]
+        items = rows[(page - 1) * limit:page * limit]
+        has_more = page * limit < len(rows)
+        return SimpleNamespace(
+            result=SimpleNamespace(items=items, pagination=SimpleNamespace(total_count=len(rows))),
+            next=(lambda: self.list(page=page + 1, limit=limit, **filters)) if has_more else (lambda: None),
+        )
+
+
+class _Customers(_Resource):
+    def get_state(self, id: str):
+        """Customer state: here, the benefits of every product they ordered."""
+        self.sdk.calls["customer_state"] += 1
+        if self.sdk.latency:
+            time.sleep(self.sdk.latency)
+        product_ids = {o.product_id for o in self.sdk.orders.rows if o.customer_id == id}
+        granted = [SimpleNamespace(benefit_id=b.id, benefit_type=b.type)
+                   for p in self.sdk.products.rows if p.id in product_ids for b in p.benefits]
+        return SimpleNamespace(id=id, granted_benefits=granted, active_subscriptions=[])
+
+
+def _sdk_object(row: Dict[str, Any]) -> SimpleNamespace:
+    """Dataset row -> SDK-like model: nested dicts become objects and *_at
+    strings become datetimes, as polar_sdk returns them."""
+    fields = {}
+    for name, value in row.items():
+        if isinstance(value, dict):
+            value = _sdk_object(value)
+        elif name.endswith("_at") and isinstance(value, str):
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        fields[name] = value
+    return SimpleNamespace(**fields)
+
+
+class FakePolarSDK:
+    """Just enough of polar_sdk.Polar for the backend, built from a dataset.
+
+    ``calls`` counts list() pages per resource, i.e. upstream round-trips.
+    """
+
+    def __init__(self, dataset: Dict[str, Any], latency_ms: float = 0.0, page_size: int = 100):
+        self.latency = latency_ms / 1000.0
+        self.page_size = page_size
+        self.calls: Counter = Counter()
+        ns = SimpleNamespace
+        products = {}
+        for p in dataset["products"]:
+            benefits = [ns(id=b["id"], type=b["type"], TYPE=b["type"],
+                           properties=ns(files=[f["id"] for f in dataset["files"].values()
+                                                if f["benefit_id"] == b["id"]]))
+                        for b in p["benefits"]]
+            products[p["id"]] = ns(
+                id=p["id"], name=p["name"], description="", is_archived=False, is_recurring=False,
+                recurring_interval=None, medias=[], benefits=benefits,
+                prices=[ns(price_amount=p.get("price_amount", 0), recurring_interval=None)],
+            )
+        self.products = _Resource("products", list(products.values()), self)
+        self.customers = _Customers("customers", [_sdk_object(c) for c in dataset["customers"]], self)
+        orders = []
+        for o in dataset["orders"]:
+            order = _sdk_object(o)
+            order.product = ns(id=o["product_id"], name=products[o["product_id"]].name)
+            orders.append(order)
+        self.orders = _Resource("orders", orders, self)
+        self.license_keys = _Resource("license_keys", [_sdk_object(k) for k in dataset["license_keys"]], self)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--customers", type=int, default=50)
+    parser.add_argument("--files", type=int, default=5, help="files in the multi-file product")
+    parser.add_argument("--file-size-mb", type=float, default=20)
+    parser.add_argument("--single-file-size-mb", type=float, default=None,
+                        help="size of the single-file product's file (default: --file-size-mb)")
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--dataset", help="serve a JSON dataset written by dataset.py instead")
+    args = parser.parse_args()
+
+    import json
+    import uvicorn
+    if args.dataset:
+        with open(args.dataset) as f:
+            dataset = json.load(f)
+    else:
+        single = int(args.single_file_size_mb * 1024 * 1024) if args.single_file_size_mb else None
+        dataset = build_download_dataset(args.customers, args.files, int(args.file_size_mb * 1024 * 1024), single)
+    uvicorn.run(create_app(dataset, args.latency_ms), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Run the backend against a fake_polar.py server instead of Polar.
+
+Direct API calls go to the fake via POLAR_API_BASE_URL; SDK calls are
+answered by FakePolarSDK built from the fake's /_dataset. Caches are kept
+under --cache-dir (CACHE_DIR) so a benchmark never touches the real ones,
+and nothing talks to GitHub: the content service is left unconfigured and
+the releases refresh reads the fake's empty /_releases.
+
+    python bench/serve_backend.py --fake-url http://127.0.0.1:8100 --port 8200 --cache-dir /tmp/bench-cache
+"""
+import argparse
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fake-url", required=True)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8200)
+    parser.add_argument("--cache-dir", required=True)
+    parser.add_argument("--log", action="store_true", help="keep the backend's request logging")
+    args = parser.parse_args()
+
+    import httpx
+    dataset = httpx.get(f"{args.fake_url}/_dataset", timeout=600).json()
+
+    os.environ.update({
+        "POLAR_API_BASE_URL": args.fake_url,
+        "POLAR_SANDBOX_MODE": "false",
+        "POLAR_PRODUCTION_TOKEN": "polar_bench_token",
+        "POLAR_ORGANIZATION_ID": dataset["organization_id"],
+        # Every cache path in main is built from CACHE_DIR at import
+        "CACHE_DIR": args.cache_dir,
+        # Set, even if empty, so .env can't enable the content mirror
+        "GITHUB_CONTENT_TOKEN": "",
+    })
+    os.makedirs(args.cache_dir, exist_ok=True)
+    if not args.log:
+        # The backend logs every step with print(); at benchmark rates that
+        # is mostly measuring the terminal.
+        sys.stdout = open(os.devnull, "w")
+
+    import main as backend
+    from fake_polar import FakePolarSDK
+
+    sdk = FakePolarSDK(dataset, latency_ms=dataset.get("latency_ms", 0))
+    backend.get_polar_client = lambda: sdk
+    # These live next to main.py rather than under CACHE_DIR
+    backend.CATALOG_CACHE_FILE = os.path.join(args.cache_dir, "catalog_cache.json")
+    backend.LICENSE_REPLICA_FILE = os.path.join(args.cache_dir, "license_keys.db")
+    backend.GITHUB_RELEASES_API = f"{args.fake_url}/_releases"
+
+    @backend.app.get("/_bench/sdk-calls")
+    async def sdk_calls():
+        return dict(sdk.calls)
+
+    @backend.app.post("/_bench/sdk-calls/reset")
+    async def reset_sdk_calls():
+        sdk.calls.clear()
+        return {}
+
+    import uvicorn
+    uvicorn.run(backend.app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
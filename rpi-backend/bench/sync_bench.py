@@ -0,0 +1,176 @@
+"""Scaling benchmark for /api/sync-purchases and download authorization.
+
+For each dataset size, generates a synthetic organization (dataset.py),
+serves it from fake_polar.py, starts the backend against it and times:
+
+  sync       POST /api/sync-purchases for a customer
+  authorize  GET  /api/download/authorize for a product that customer owns
+
+for customers at the start, middle and end of Polar's customer listing (list
+scans get slower the further in a customer is) plus an unknown email.
+Each row shows the first (cold) request, the median of the rest, upstream
+calls per request (SDK list() pages plus direct API calls) and, for sync,
+how many of the customer's purchases came back.
+
+    python bench/sync_bench.py --orders 1000,10000,50000 --latency-ms 40
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from dataset import generate_dataset  # noqa: E402
+from download_bench import _wait_until_up  # noqa: E402
+
+
+def _wait_until_idle(base: str, settle: float = 1.0, timeout: float = 600.0):
+    """Wait for the backend's startup syncs (e.g. the license replica) to stop
+    calling the SDK, so they don't land in the measurements."""
+    deadline = time.monotonic() + timeout
+    last = None
+    while time.monotonic() < deadline:
+        calls = httpx.get(f"{base}/_bench/sdk-calls", timeout=10).json()
+        if calls == last:
+            return
+        last = calls
+        time.sleep(settle)
+
+
+def _probes(dataset: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Customers at the start, middle and end of the listing, each with the
+    number of purchases they have and a downloadable product they own."""
+    customers = dataset["customers"]
+    downloadable = {p["id"] for p in dataset["products"] if p["benefits"][0]["type"] == "downloadables"}
+    orders_by_customer: Dict[str, List[str]] = {}
+    for o in dataset["orders"]:
+        orders_by_customer.setdefault(o["customer_id"], []).append(o["product_id"])
+
+    probes = []
+    for label, index in (("first", 0), ("middle", len(customers) // 2), ("last", len(customers) - 1)):
+        # Step back to the nearest customer who owns something downloadable
+        for i in range(index, -1, -1):
+            owned = orders_by_customer.get(customers[i]["id"], [])
+            product_id = next((p for p in owned if p in downloadable), None)
+            if product_id:
+                probes.append({"label": label, "email": customers[i]["email"],
+                               "purchases": len(owned), "product_id": product_id})
+                break
+    probes.append({"label": "unknown", "email": "nobody@bench.test", "purchases": 0,
+                   "product_id": dataset["products"][-1]["id"]})
+    return probes
+
+
+def _upstream_calls(base: str, fake_url: str) -> int:
+    sdk = httpx.get(f"{base}/_bench/sdk-calls", timeout=10).json()
+    direct = httpx.get(f"{fake_url}/_stats", timeout=10).json()
+    return sum(sdk.values()) + sum(n for name, n in direct.items() if not name.startswith("file_"))
+
+
+def _reset_counters(base: str, fake_url: str):
+    httpx.post(f"{base}/_bench/sdk-calls/reset", timeout=10)
+    httpx.post(f"{fake_url}/_stats/reset", timeout=10)
+
+
+def _measure(base: str, fake_url: str, samples: int, request) -> Dict[str, Any]:
+    latencies, calls, found = [], [], None
+    for _ in range(samples):
+        _reset_counters(base, fake_url)
+        started = time.perf_counter()
+        resp = request()
+        latencies.append((time.perf_counter() - started) * 1000)
+        calls.append(_upstream_calls(base, fake_url))
+        body = resp.json()
+        if found is None and "purchases" in body:
+            found = len(body.get("purchases") or [])
+    return {
+        "cold_ms": latencies[0],
+        "warm_ms": statistics.median(latencies[1:]) if len(latencies) > 1 else float("nan"),
+        "cold_calls": calls[0],
+        "warm_calls": statistics.median(calls[1:]) if len(calls) > 1 else float("nan"),
+        "found": found,
+    }
+
+
+def _run_size(args, orders: int) -> List[Dict[str, Any]]:
+    workdir = tempfile.mkdtemp(prefix="bench-sync-")
+    dataset_file = os.path.join(workdir, "dataset.json")
+    print(f"▶ generating {orders} orders", file=sys.stderr)
+    dataset = generate_dataset(orders, seed=args.seed)
+    with open(dataset_file, "w") as f:
+        json.dump(dataset, f)
+
+    fake_url = f"http://127.0.0.1:{args.fake_port}"
+    base = f"http://127.0.0.1:{args.port}"
+    fake = subprocess.Popen([sys.executable, os.path.join(HERE, "fake_polar.py"), "--port", str(args.fake_port),
+                             "--dataset", dataset_file, "--latency-ms", str(args.latency_ms)])
+    backend: Optional[subprocess.Popen] = None
+    rows = []
+    try:
+        _wait_until_up(f"{fake_url}/_stats", fake)
+        backend = subprocess.Popen([sys.executable, os.path.join(HERE, "serve_backend.py"),
+                                    "--fake-url", fake_url, "--port", str(args.port),
+                                    "--cache-dir", os.path.join(workdir, "cache")])
+        _wait_until_up(f"{base}/", backend)
+        _wait_until_idle(base)
+
+        with httpx.Client(timeout=600) as client:
+            for probe in _probes(dataset):
+                sync = _measure(base, fake_url, args.samples, lambda: client.post(
+                    f"{base}/api/sync-purchases", json={"email": probe["email"]}))
+                authorize = _measure(base, fake_url, args.samples, lambda: client.get(
+                    f"{base}/api/download/authorize",
+                    params={"email": probe["email"], "product_id": probe["product_id"]}))
+                rows.append({"orders": orders, "customer": probe["label"],
+                             "expected": probe["purchases"], "sync": sync, "authorize": authorize})
+    finally:
+        for proc in (backend, fake):
+            if proc is not None:
+                proc.terminate()
+                proc.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return rows
+
+
+def _print_table(rows: List[Dict[str, Any]]):
+    header = (f"{'orders':>8} {'customer':<8}"
+              f"{'sync ms':>10}{'warm':>8}{'calls':>7}{'found':>9}"
+              f"{'auth ms':>10}{'warm':>8}{'calls':>7}{'warm':>6}")
+    print(header)
+    print("-" * len(header))
+    for r in rows:
+        s, a = r["sync"], r["authorize"]
+        found = f"{s['found']}/{r['expected']}" if s["found"] is not None else "-"
+        print(f"{r['orders']:>8} {r['customer']:<8}"
+              f"{s['cold_ms']:>10.0f}{s['warm_ms']:>8.0f}{s['cold_calls']:>7}{found:>9}"
+              f"{a['cold_ms']:>10.0f}{a['warm_ms']:>8.0f}{a['cold_calls']:>7}{a['warm_calls']:>6.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", default="1000,10000,50000", help="comma-separated dataset sizes")
+    parser.add_argument("--latency-ms", type=float, default=40, help="fake Polar latency per call/page")
+    parser.add_argument("--samples", type=int, default=3, help="requests per probe; the first is cold")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--fake-port", type=int, default=8100)
+    parser.add_argument("--port", type=int, default=8200)
+    args = parser.parse_args()
+
+    rows = []
+    for orders in (int(n) for n in args.orders.split(",")):
+        rows += _run_size(args, orders)
+    _print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-from fastapi import FastAPI, BackgroundTasks, File, Form, HTTPException, UploadFile
+from fastapi import FastAPI, BackgroundTasks, Depends, File, Form, HTTPException, Request, Response, UploadFile
 from fastapi.responses import JSONResponse, StreamingResponse, RedirectResponse, FileResponse
 from starlette.background import BackgroundTask
 from fastapi.middleware.cors import CORSMiddleware
@@ -6,58 +6,257 @@ from typing import List, Optional, Dict, Any
 from pydantic import BaseModel
 import os
 import httpx
-from dotenv import load_dotenv
+from dotenv import find_dotenv, load_dotenv
 import time
 import sys
 import json
 import tempfile
 import asyncio  # Required for the analytics write lock
 import hashlib  # Required for analytics visitor hashing
+from collections import OrderedDict
+from dataclasses import dataclass
 from polar_sdk import Polar
 
 # Load environment variables from .env file
-load_dotenv()
+ENV_FILE = find_dotenv()
+load_dotenv(ENV_FILE)
+
+# ==================== SETTINGS ====================
+# Configuration is parsed from the environment once into an immutable Settings
+# object instead of being re-read on every request. Send SIGHUP or edit the
+# .env file to reload it without a restart; a reload that fails to parse keeps
+# the previous settings.
+
+@dataclass(frozen=True)
+class Settings:
+    polar_sandbox: bool
+    polar_sandbox_token: Optional[str]
+    polar_production_token: Optional[str]
+    polar_organization_id: Optional[str]
+    polar_desktop_product_id: str
+    polar_api_base_url: str  # override for direct API calls, e.g. a local stand-in
+    test_license_key: str
+    admin_key_hashes: frozenset  # SHA-256 hex of each upper-cased ADMIN_KEYS entry
+    smtp_host: str
+    smtp_port: int
+    smtp_user: Optional[str]
+    smtp_pass: Optional[str]
+    feedback_email: str
+    content_repo: str
+    content_branch: str
+    github_content_token: str
+    catalog_max_age_seconds: int
+    license_cache_ttl_seconds: int
+    license_negative_cache_ttl_seconds: int
+    max_batch_license_keys: int
+    license_batch_concurrency: int
+    license_token_private_key: str
+    license_token_refresh_seconds: int
+    license_token_max_age_seconds: int
+    license_replica_sync_seconds: int
+    license_replica_max_age_seconds: int
+    sync_deadline_seconds: float
+    sync_cursor_max_age_seconds: int
+    entitlement_cache_ttl_seconds: int
+    content_cache_max_mb: int
+    content_cache_fresh_seconds: int
+    content_mirror_sync_seconds: int
+    content_negative_cache_ttl_seconds: int
+    releases_refresh_seconds: int
+    file_cache_max_mb: int
+    bundle_cache_max_mb: int
+    download_link_secret: str
+    download_link_ttl_seconds: int
+    downloadables_cache_ttl_seconds: int
+
+    @property
+    def polar_token(self) -> Optional[str]:
+        return self.polar_sandbox_token if self.polar_sandbox else self.polar_production_token
+
+    @property
+    def polar_base_url(self) -> str:
+        if self.polar_api_base_url:
+            return self.polar_api_base_url.rstrip("/")
+        return "https://sandbox-api.polar.sh" if self.polar_sandbox else "https://api.polar.sh"
+
+
+def _hash_admin_key(key: str) -> str:
+    return hashlib.sha256(key.strip().upper().encode()).hexdigest()
+
+
+def load_settings() -> Settings:
+    env = os.environ
+    return Settings(
+        polar_sandbox=env.get("POLAR_SANDBOX_MODE", "false").lower() == "true",
+        polar_sandbox_token=env.get("POLAR_SANDBOX_TOKEN"),
+        polar_production_token=env.get("POLAR_PRODUCTION_TOKEN"),
+        polar_organization_id=env.get("POLAR_ORGANIZATION_ID"),
+        # Desktop app subscription product ID (for product-specific validation)
+        polar_desktop_product_id=env.get("POLAR_DESKTOP_PRODUCT_ID", ""),
+        polar_api_base_url=env.get("POLAR_API_BASE_URL", ""),
+        test_license_key=env.get("TEST_LICENSE_KEY", ""),
+        admin_key_hashes=frozenset(
+            _hash_admin_key(k) for k in env.get("ADMIN_KEYS", "").split(",") if k.strip()
+        ),
+        smtp_host=env.get("SMTP_HOST", "smtp.gmail.com"),
+        smtp_port=int(env.get("SMTP_PORT", "587")),
+        smtp_user=env.get("SMTP_USER"),
+        smtp_pass=env.get("SMTP_PASS"),
+        feedback_email=env.get("FEEDBACK_EMAIL", "support@littleoatlearners.com"),
+        content_repo=env.get("CONTENT_REPO", "Streamline1175/homeschool-content"),
+        content_branch=env.get("CONTENT_BRANCH", "main"),
+        github_content_token=env.get("GITHUB_CONTENT_TOKEN", ""),
+        catalog_max_age_seconds=int(env.get("CATALOG_MAX_AGE_SECONDS", "300")),
+        license_cache_ttl_seconds=int(env.get("LICENSE_CACHE_TTL_SECONDS", "900")),
+        license_negative_cache_ttl_seconds=int(env.get("LICENSE_NEGATIVE_CACHE_TTL_SECONDS", "60")),
+        max_batch_license_keys=int(env.get("MAX_BATCH_LICENSE_KEYS", "50")),
+        license_batch_concurrency=int(env.get("LICENSE_BATCH_CONCURRENCY", "8")),
+        license_token_private_key=env.get("LICENSE_TOKEN_PRIVATE_KEY", ""),
+        license_token_refresh_seconds=int(env.get("LICENSE_TOKEN_REFRESH_SECONDS", str(3 * 86400))),
+        license_token_max_age_seconds=int(env.get("LICENSE_TOKEN_MAX_AGE_SECONDS", str(30 * 86400))),
+        license_replica_sync_seconds=int(env.get("LICENSE_REPLICA_SYNC_SECONDS", "600")),
+        license_replica_max_age_seconds=int(env.get("LICENSE_REPLICA_MAX_AGE_SECONDS", str(3 * 86400))),
+        sync_deadline_seconds=float(env.get("SYNC_DEADLINE_SECONDS", "15")),
+        sync_cursor_max_age_seconds=int(env.get("SYNC_CURSOR_MAX_AGE_SECONDS", str(30 * 86400))),
+        entitlement_cache_ttl_seconds=int(env.get("ENTITLEMENT_CACHE_TTL_SECONDS", "600")),
+        content_cache_max_mb=int(env.get("CONTENT_CACHE_MAX_MB", "512")),
+        content_cache_fresh_seconds=int(env.get("CONTENT_CACHE_FRESH_SECONDS", "60")),
+        content_mirror_sync_seconds=int(env.get("CONTENT_MIRROR_SYNC_SECONDS", "300")),
+        content_negative_cache_ttl_seconds=int(env.get("CONTENT_NEGATIVE_CACHE_TTL_SECONDS", "60")),
+        releases_refresh_seconds=int(env.get("RELEASES_REFRESH_SECONDS", "300")),
+        file_cache_max_mb=int(env.get("FILE_CACHE_MAX_MB", "2048")),
+        bundle_cache_max_mb=int(env.get("BUNDLE_CACHE_MAX_MB", "2048")),
+        download_link_secret=env.get("DOWNLOAD_LINK_SECRET", ""),
+        download_link_ttl_seconds=int(env.get("DOWNLOAD_LINK_TTL_SECONDS", "900")),
+        downloadables_cache_ttl_seconds=int(env.get("DOWNLOADABLES_CACHE_TTL_SECONDS", "300")),
+    )
+
+
+_settings = load_settings()
+
+
+def get_settings() -> Settings:
+    """Current settings; also used as a FastAPI dependency."""
+    return _settings
+
+
+def reload_settings():
+    global _settings
+    try:
+        load_dotenv(ENV_FILE, override=True)
+        _settings = load_settings()
+        print("🔄 Settings reloaded")
+    except Exception as e:
+        print(f"⚠️ Settings reload failed, keeping previous settings: {e}")
+
 
 # Initialize Polar SDK client
 def is_sandbox_mode():
     """Check if Polar sandbox mode is enabled"""
-    return os.getenv("POLAR_SANDBOX_MODE", "false").lower() == "true"
+    return get_settings().polar_sandbox
+
+# SDK clients by (mode, token), so a client is built once rather than per
+# request, and a settings reload that changes the token gets a new one.
+_polar_clients: Dict[tuple, Any] = {}
 
 def get_polar_client():
     """Get Polar client configured for sandbox or production based on env settings"""
-    sandbox = is_sandbox_mode()
+    settings = get_settings()
+    sandbox = settings.polar_sandbox
+    access_token = settings.polar_token
 
-    if sandbox:
-        access_token = os.getenv("POLAR_SANDBOX_TOKEN")
-        if not access_token:
+    if not access_token:
+        if sandbox:
             print("⚠️ POLAR_SANDBOX_MODE is enabled but POLAR_SANDBOX_TOKEN is not set")
-            return None
-        print("🧪 Using Polar SANDBOX mode")
-        return Polar(server="sandbox", access_token=access_token)
-    else:
-        access_token = os.getenv("POLAR_PRODUCTION_TOKEN")
-        if not access_token:
+        else:
             print("⚠️ POLAR_PRODUCTION_TOKEN is not set")
-            return None
-        print("🚀 Using Polar PRODUCTION mode")
-        return Polar(access_token=access_token)
+        return None
+
+    client = _polar_clients.get((sandbox, access_token))
+    if client is None:
+        if sandbox:
+            print("🧪 Using Polar SANDBOX mode")
+            client = Polar(server="sandbox", access_token=access_token)
+        else:
+            print("🚀 Using Polar PRODUCTION mode")
+            client = Polar(access_token=access_token)
+        _polar_clients.clear()
+        _polar_clients[(sandbox, access_token)] = client
+    return client
 
 def get_polar_api_config():
     """Get API base URL and token for direct httpx calls"""
-    sandbox = is_sandbox_mode()
-    if sandbox:
-        return {
-            "base_url": "https://sandbox-api.polar.sh",
-            "token": os.getenv("POLAR_SANDBOX_TOKEN")
-        }
-    else:
-        return {
-            "base_url": "https://api.polar.sh",
-            "token": os.getenv("POLAR_PRODUCTION_TOKEN")
-        }
+    settings = get_settings()
+    return {
+        "base_url": settings.polar_base_url,
+        "token": settings.polar_token
+    }
+
+def _iter_polar_items(response):
+    """Yield the items of every page of a Polar SDK list() response."""
+    while response is not None:
+        result = getattr(response, "result", None)
+        if result is None:
+            break
+        yield from result.items
+        next_page = getattr(response, "next", None)
+        response = next_page() if callable(next_page) else None
+
+# Shared connection pool for direct Polar API calls, so hot paths such as
+# license validation reuse TLS connections instead of opening a client per call.
+_polar_http: Optional[httpx.AsyncClient] = None
+
+def get_polar_http() -> httpx.AsyncClient:
+    global _polar_http
+    if _polar_http is None or _polar_http.is_closed:
+        _polar_http = httpx.AsyncClient(
+            timeout=30.0,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+        )
+    return _polar_http
 
 app = FastAPI()
 
+@app.on_event("shutdown")
+async def _close_polar_http():
+    if _polar_http is not None:
+        await _polar_http.aclose()
+
+
+async def _watch_env_file():
+    """Reload settings when the .env file's modification time changes."""
+    last_mtime = None
+    while True:
+        try:
+            mtime = os.path.getmtime(ENV_FILE) if ENV_FILE else None
+        except OSError:
+            mtime = None
+        if last_mtime is not None and mtime is not None and mtime != last_mtime:
+            reload_settings()
+        last_mtime = mtime
+        await asyncio.sleep(5)
+
+
+_settings_watch_task: Optional[asyncio.Task] = None
+
+
+@app.on_event("startup")
+async def _start_settings_reload():
+    global _settings_watch_task
+    import signal
+    if hasattr(signal, "SIGHUP"):
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, reload_settings)
+        except (NotImplementedError, RuntimeError):
+            pass
+    _settings_watch_task = asyncio.create_task(_watch_env_file())
+
+
+@app.on_event("shutdown")
+async def _stop_settings_reload():
+    if _settings_watch_task is not None:
+        _settings_watch_task.cancel()
+
 # Allow interactions from the desktop app (which might be localhost or another IP)
 app.add_middleware(
     CORSMiddleware,
@@ -115,6 +314,330 @@ products_db = [
     }
 ]
 
+# ==================== UPSTREAM REQUEST COALESCING ====================
+
+class SingleFlight:
+    """Coalesce concurrent identical upstream fetches into one.
+
+    The first caller for a key starts the fetch; callers arriving while it is
+    in flight await the same task and receive its result or its exception.
+    The key is released as soon as the fetch settles, so this bounds upstream
+    fan-out to one request per key without caching anything.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Any, asyncio.Task] = {}
+
+    async def do(self, key, fn, timeout: Optional[float] = None):
+        """Run ``fn()`` (a coroutine factory) once per in-flight ``key``.
+
+        ``timeout`` bounds the shared fetch itself, so every waiter on that key
+        gets the same asyncio.TimeoutError rather than each timing out alone.
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._run(key, fn, timeout))
+            # Mark the exception retrieved even if every waiter went away.
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._inflight[key] = task
+        # Shielded: one client disconnecting must not cancel the fetch other
+        # callers are waiting on.
+        return await asyncio.shield(task)
+
+    async def _run(self, key, fn, timeout):
+        try:
+            if timeout is None:
+                return await fn()
+            return await asyncio.wait_for(fn(), timeout)
+        finally:
+            self._inflight.pop(key, None)
+
+
+_upstream_flights = SingleFlight()
+
+
+class TTLCache:
+    """Small in-memory LRU cache whose entries each carry their own expiry."""
+
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Any, tuple]" = OrderedDict()
+
+    def get(self, key, default=None):
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return default
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl: float):
+        self._entries[key] = (value, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def pop(self, key, default=None):
+        entry = self._entries.pop(key, None)
+        return default if entry is None else entry[0]
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# Runtime caches live next to main.py, like the analytics and catalog files,
+# unless CACHE_DIR points elsewhere. Read once at import: every cache path
+# below is built from it.
+CACHE_ROOT = os.environ.get("CACHE_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
+
+
+class DiskCache:
+    """Files on disk under a byte budget, evicted least-recently-used first.
+
+    Entries are written to a temp file inside the cache directory and
+    published with os.replace, so readers never see a partial file. Recency
+    is tracked in memory and mirrored into mtimes, so LRU order survives a
+    restart. Entries being served are pinned with acquire()/release() and
+    are never evicted while pinned. ``max_bytes`` is a callable so a
+    settings reload can resize the budget.
+    """
+
+    def __init__(self, directory: str, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.filling: set = set()  # names currently being written
+        self._index: "OrderedDict[str, int]" = OrderedDict()  # name -> size, oldest first
+        self._refs: Dict[str, int] = {}  # name -> responses currently reading it
+        self._loaded = False
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        found = []
+        for root, _, files in os.walk(self.directory):
+            for fname in files:
+                full = os.path.join(root, fname)
+                if fname.endswith(".tmp"):
+                    # Left behind by an interrupted fill
+                    try:
+                        os.unlink(full)
+                    except OSError:
+                        pass
+                    continue
+                try:
+                    st = os.stat(full)
+                except OSError:
+                    continue
+                found.append((st.st_mtime, fname, st.st_size))
+        for _, fname, size in sorted(found):
+            self._index[fname] = size
+        self._loaded = True
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name[:2], name)
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(self._index.values())
+
+    def get(self, name: str) -> Optional[str]:
+        """Path of a cached entry (marking it recently used), or None."""
+        self._ensure_loaded()
+        if name not in self._index:
+            return None
+        path = self.path(name)
+        if not os.path.exists(path):
+            del self._index[name]
+            return None
+        self._index.move_to_end(name)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return path
+
+    def acquire(self, name: str) -> Optional[str]:
+        """Like get(), but pins the entry until release(name) is called."""
+        path = self.get(name)
+        if path is not None:
+            self._refs[name] = self._refs.get(name, 0) + 1
+        return path
+
+    def release(self, name: str):
+        count = self._refs.get(name, 0) - 1
+        if count > 0:
+            self._refs[name] = count
+        else:
+            self._refs.pop(name, None)
+            self._evict()
+
+    def temp_file(self):
+        """(fd, path) of a new temp file on the cache's filesystem."""
+        self._ensure_loaded()
+        return tempfile.mkstemp(dir=self.directory, prefix=".fill-", suffix=".tmp")
+
+    def publish(self, name: str, tmp_path: str) -> str:
+        self._ensure_loaded()
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+        self._index[name] = os.path.getsize(path)
+        self._index.move_to_end(name)
+        self._evict()
+        return path
+
+    def _evict(self):
+        budget = self.max_bytes()
+        total = self.total_bytes
+        for name in list(self._index):
+            if total <= budget:
+                break
+            if self._refs.get(name):
+                continue
+            size = self._index.pop(name)
+            total -= size
+            try:
+                os.unlink(self.path(name))
+                print(f"🗑️ Evicted {name[:16]}... ({size} bytes) from {os.path.basename(self.directory)} cache")
+            except OSError:
+                pass
+
+
+class _PinnedFileResponse(FileResponse):
+    """FileResponse for a DiskCache entry that stays pinned until the send
+    finishes, however it finishes (including client disconnects)."""
+
+    def __init__(self, path: str, *, cache: DiskCache, name: str, **kwargs):
+        super().__init__(path, **kwargs)
+        self._cache = cache
+        self._name = name
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self._cache.release(self._name)
+
+
+class _CacheFill:
+    """A DiskCache entry written by a background task, readable as it grows.
+
+    The task drains ``chunks`` into a temp file at upstream speed whether or
+    not anyone is listening, and publishes it once it is complete and
+    verified against the expected SHA-256 and size (and ``verify()``, if
+    given); anything else just discards the temp file. Every response for the entry tails
+    that file through open(), so a slow client only slows itself and a
+    disconnect never cancels the fill. While it runs the fill is listed in
+    ``registry`` under its name, for later requests to find and join.
+    """
+
+    def __init__(self, cache: DiskCache, name: str, chunks, registry: Dict[str, "_CacheFill"],
+                 expected_sha256: Optional[str] = None, expected_size: Optional[int] = None,
+                 verify=None, on_publish=None, media_type: Optional[str] = None, headers: Optional[Dict[str, str]] = None):
+        self.cache = cache
+        self.name = name
+        self.media_type = media_type
+        self.headers = headers or {}
+        self.size = 0  # bytes written and flushed so far
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self._registry = registry
+        self._changed = asyncio.Event()
+        cache.filling.add(name)
+        fd, self.tmp_path = cache.temp_file()
+        registry[name] = self
+        self.task = asyncio.create_task(self._run(fd, chunks, expected_sha256, expected_size, verify, on_publish))
+
+    def _notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def _run(self, fd: int, chunks, expected_sha256, expected_size, verify, on_publish):
+        hasher = hashlib.sha256()
+
+        def append(f, chunk):
+            f.write(chunk)
+            f.flush()  # Readers use their own handles
+            hasher.update(chunk)
+
+        try:
+            with os.fdopen(fd, "wb") as f:
+                async for chunk in chunks:
+                    # Off the event loop: a slow SD card must not stall every other request
+                    await asyncio.to_thread(append, f, chunk)
+                    self.size += len(chunk)
+                    self._notify()
+        except BaseException as e:
+            self.error = e
+            print(f"   ❌ Filling {self.name[:16]}... failed: {e!r}")
+        finally:
+            # Unlisted before the temp file moves, so nobody opens a stale path
+            if self._registry.get(self.name) is self:
+                del self._registry[self.name]
+            self.cache.filling.discard(self.name)
+            verified = self.error is None and (
+                (expected_sha256 is None or hasher.hexdigest() == expected_sha256)
+                and (expected_size is None or self.size == expected_size)
+                and (verify is None or verify())
+            )
+            if verified:
+                self.cache.publish(self.name, self.tmp_path)
+            else:
+                if self.error is None:
+                    print(f"   ⚠️ Integrity check failed for {self.name[:16]}..., not caching")
+                try:
+                    os.unlink(self.tmp_path)
+                except OSError:
+                    pass
+            self.done = True
+            self._notify()
+        if verified and on_publish is not None:
+            await on_publish()
+
+    def open(self, chunk_size: int = 64 * 1024):
+        """Async iterator over the entry's bytes, from the start, following
+        the fill until it ends. The temp file is opened here and now: open
+        file handles survive it being published or deleted."""
+        f = open(self.tmp_path, "rb")
+        return self._tail(f, chunk_size)
+
+    async def _tail(self, f, chunk_size: int):
+        offset = 0
+        try:
+            while True:
+                if offset < self.size:
+                    chunk = await asyncio.to_thread(f.read, min(chunk_size, self.size - offset))
+                    offset += len(chunk)
+                    yield chunk
+                elif self.done:
+                    if self.error is not None:
+                        raise RuntimeError(f"fill of {self.name[:16]}... failed") from self.error
+                    return
+                else:
+                    await self._changed.wait()
+        finally:
+            f.close()
+
+
+async def _iter_local_file(path: str, chunk_size: int = 64 * 1024):
+    """Yield a file's bytes without blocking the event loop on disk reads."""
+    f = await asyncio.to_thread(open, path, "rb")
+    try:
+        while True:
+            chunk = await asyncio.to_thread(f.read, chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        f.close()
+
 # ==================== ANALYTICS ====================
 
 # Absolute path: the data file must not depend on the process working directory.
@@ -163,21 +686,19 @@ def load_analytics() -> Dict[str, Any]:
         return {}
 
 
-def save_analytics(data: Dict[str, Any]):
+def _atomic_write_json(path: str, data: Any, prefix: str):
     """Write to a temp file and atomically rename over the target, so an
     interrupted write cannot truncate or corrupt the existing data."""
     tmp_path = None
     try:
-        directory = os.path.dirname(ANALYTICS_FILE) or "."
-        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".analytics-", suffix=".tmp")
+        directory = os.path.dirname(path) or "."
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=prefix, suffix=".tmp")
         with os.fdopen(fd, "w") as f:
             json.dump(data, f, indent=2)
             f.flush()
             os.fsync(f.fileno())
-        os.replace(tmp_path, ANALYTICS_FILE)
+        os.replace(tmp_path, path)
         tmp_path = None
-    except Exception as e:
-        print(f"⚠️ Error writing analytics file: {e}")
     finally:
         if tmp_path and os.path.exists(tmp_path):
             try:
@@ -186,6 +707,13 @@ def save_analytics(data: Dict[str, Any]):
                 pass
 
 
+def save_analytics(data: Dict[str, Any]):
+    try:
+        _atomic_write_json(ANALYTICS_FILE, data, prefix=".analytics-")
+    except Exception as e:
+        print(f"⚠️ Error writing analytics file: {e}")
+
+
 @app.post("/api/analytics/track")
 async def track_visit(event: AnalyticsEvent):
     today = time.strftime("%Y-%m-%d")
@@ -277,163 +805,264 @@ async def health_check():
             "reason": str(e)
         })
 
+def _fetch_live_catalog(polar) -> List[Dict[str, Any]]:
+    """List products from Polar and transform them into the shop format.
+
+    Blocking (the SDK is synchronous) and raises on any Polar error, so
+    callers run it in a worker thread and decide what to fall back to.
+    """
+    live_products = []
+
+    # List all products from Polar
+    products_response = polar.products.list()
+
+    if products_response and products_response.result:
+        for product in products_response.result.items:
+            # Filter out archived and internal products
+            if getattr(product, 'is_archived', False):
+                continue
+            name_check = product.name.lower() if product.name else ""
+            if "cart-bundle" in name_check or "cart bundle" in name_check:
+                continue
+
+            # Determine if this is a subscription product using product-level is_recurring
+            is_subscription = getattr(product, 'is_recurring', False)
+            interval = getattr(product, 'recurring_interval', None)
+            interval_count = getattr(product, 'recurring_interval_count', 1)
+
+            # Get price info from the first price if available
+            price_formatted = "$0.00"
+            if hasattr(product, 'prices') and product.prices:
+                first_price = product.prices[0]
+                if hasattr(first_price, 'price_amount'):
+                    price_formatted = f"${first_price.price_amount / 100:.2f}"
+                # Get interval from price if not set at product level
+                if not interval and hasattr(first_price, 'recurring_interval'):
+                    interval = first_price.recurring_interval
+                    interval_count = getattr(first_price, 'recurring_interval_count', 1)
+
+            # Determine category from name AND description (keyword matching)
+            name_lower = (product.name or "").lower()
+            desc_lower = (product.description or "").lower()
+            combined_text = name_lower + " " + desc_lower
+
+            # Category detection - based on content keywords (subscription is NOT a category)
+            # Subscription status is tracked via is_subscription field instead
+            if "bundle" in name_lower or "complete" in name_lower or "pack" in name_lower:
+                category = "bundle"
+            elif any(kw in combined_text for kw in ["math", "arithmetic", "algebra", "geometry", "counting", "multiplication"]):
+                category = "math"
+            elif any(kw in combined_text for kw in ["read", "phonics", "literacy", "comprehension", "vocabulary"]):
+                category = "reading"
+            elif any(kw in combined_text for kw in ["science", "biology", "chemistry", "physics", "nature", "experiment"]):
+                category = "science"
+            elif any(kw in combined_text for kw in ["writ", "composition", "essay", "grammar", "spelling"]):
+                category = "writing"
+            elif any(kw in combined_text for kw in ["premium", "license", "subscription", "membership"]):
+                category = "premium"
+            else:
+                category = "curriculum"
+
+            # Get product images if available (collect all for gallery)
+            images = []
+            image_url = None  # Keep for backwards compatibility
+            if hasattr(product, 'medias') and product.medias:
+                for media in product.medias:
+                    if hasattr(media, 'public_url') and media.public_url:
+                        images.append(media.public_url)
+                if images:
+                    image_url = images[0]  # First image for backwards compat
+
+            # Determine hasFiles and isLicenseProduct from benefits array
+            has_files = False
+            is_license_product = False
+            file_count = 0
+            
+            # Debug: Print product attributes to understand SDK structure
+            print(f"\n   🔍 DEBUG: Product '{product.name}' structure:")
+            print(f"      - Type: {type(product)}")
+            print(f"      - Has 'benefits' attr: {hasattr(product, 'benefits')}")
+            
+            # Try to get benefits multiple ways
+            benefits = None
+            if hasattr(product, 'benefits'):
+                benefits = product.benefits
+                print(f"      - benefits from attr: {benefits}")
+            elif isinstance(product, dict) and 'benefits' in product:
+                benefits = product['benefits']
+                print(f"      - benefits from dict: {benefits}")
+            
+            # If still no benefits, try to list all attributes
+            if benefits is None:
+                try:
+                    attrs = dir(product) if not isinstance(product, dict) else product.keys()
+                    benefit_related = [a for a in attrs if 'benefit' in str(a).lower()]
+                    print(f"      - Benefit-related attrs: {benefit_related}")
+                except:
+                    pass
+            
+            if benefits:
+                print(f"      - Benefits count: {len(benefits)}")
+                for i, benefit in enumerate(benefits):
+                    # SDK uses TYPE (uppercase), not type
+                    benefit_type = getattr(benefit, 'TYPE', None)
+                    if benefit_type is None:
+                        benefit_type = getattr(benefit, 'type', None)
+                    
+                    print(f"      - Benefit {i}: TYPE={benefit_type}")
+                    
+                    if benefit_type == 'downloadables':
+                        has_files = True
+                        # Count files from benefit properties
+                        props = getattr(benefit, 'properties', None)
+                        if props:
+                            files_list = getattr(props, 'files', None)
+                            if files_list:
+                                file_count = len(files_list)
+                                print(f"        - 📁 {file_count} downloadable file(s)")
+                    elif benefit_type == 'license_keys':
+                        is_license_product = True
+                        print(f"        - 🔑 License key product")
+            else:
+                print(f"      - ⚠️ No benefits found")
+
+            live_products.append({
+                "id": str(product.id),
+                "title": product.name or "Unknown Product",
+                "description": product.description or "No description provided.",
+                "price": price_formatted,
+                "image": image_url,  # Single image for backwards compat
+                "images": images,    # All images for gallery
+                "category": category,
+                "purchased": False,
+                "buyUrl": None,  # Polar uses checkout sessions instead of static URLs
+                "contentPath": None,
+                "is_subscription": is_subscription,
+                "interval": interval,
+                "interval_count": interval_count,
+                "hasFiles": has_files,
+                "fileCount": file_count,  # Number of downloadable files
+                "isLicenseProduct": is_license_product,
+                "licenseKey": None,  # Will be populated on sync for purchased products
+            })
+
+        print(f"📦 DEBUG: Fetched {len(live_products)} products from Polar:")
+        for p in live_products:
+            sub_info = f" [SUBSCRIPTION: {p['interval']}]" if p['is_subscription'] else ""
+            files_info = "📁" if p.get('hasFiles') else "📄"
+            license_info = "🔑" if p.get('isLicenseProduct') else ""
+            print(f"   - {p['title']} ({p['category']}){sub_info} {files_info}{license_info} | Images: {len(p.get('images', []))}")
+
+
+    return live_products
+
+
+# ==================== PRODUCT CATALOG CACHE ====================
+
+# Last successfully transformed catalog, persisted so that a restart serves real
+# products on the first request and a Polar outage serves the last known-good
+# catalog instead of the mock products_db above. Absolute for the same reason
+# as ANALYTICS_FILE.
+CATALOG_CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "catalog_cache.json")
+
+_catalog_cache: Dict[str, Any] = {"products": None, "fetched_at": 0.0}
+_catalog_refresh_task: Optional[asyncio.Task] = None
+
+
+def load_catalog_cache():
+    if not os.path.exists(CATALOG_CACHE_FILE):
+        return
+    try:
+        with open(CATALOG_CACHE_FILE, "r") as f:
+            data = json.load(f)
+        products = data.get("products")
+        if isinstance(products, list) and products:
+            _catalog_cache["products"] = products
+            _catalog_cache["fetched_at"] = float(data.get("fetched_at", 0.0))
+            print(f"📦 Loaded {len(products)} cached products from {CATALOG_CACHE_FILE}")
+    except Exception as e:
+        print(f"⚠️ Error reading catalog cache: {e}")
+
+
+def save_catalog_cache():
+    try:
+        _atomic_write_json(CATALOG_CACHE_FILE, _catalog_cache, prefix=".catalog-")
+    except Exception as e:
+        print(f"⚠️ Error writing catalog cache: {e}")
+
+
+async def _fetch_and_store_catalog(polar) -> List[Dict[str, Any]]:
+    products = await asyncio.to_thread(_fetch_live_catalog, polar)
+    if products:
+        _catalog_cache["products"] = products
+        _catalog_cache["fetched_at"] = time.time()
+        await asyncio.to_thread(save_catalog_cache)
+    return products
+
+
+async def _refresh_catalog(polar) -> List[Dict[str, Any]]:
+    """Fetch the live catalog and, if Polar returned any products, make it the
+    new last-known-good copy in memory and on disk. Concurrent callers share
+    one products.list() call."""
+    return await _upstream_flights.do(
+        ("polar", "products"), lambda: _fetch_and_store_catalog(polar), timeout=30.0
+    )
+
+
+async def _refresh_catalog_in_background(polar):
+    try:
+        await _refresh_catalog(polar)
+    except Exception as e:
+        print(f"⚠️ Background catalog refresh failed, keeping last known-good catalog: {e}")
+
+
+def _schedule_catalog_refresh(polar):
+    global _catalog_refresh_task
+    if _catalog_refresh_task is None or _catalog_refresh_task.done():
+        _catalog_refresh_task = asyncio.create_task(_refresh_catalog_in_background(polar))
+
+
+def _mark_catalog_stale(response: Response):
+    age = int(time.time() - _catalog_cache["fetched_at"])
+    response.headers["X-Catalog-Stale"] = "true"
+    response.headers["X-Catalog-Age"] = str(max(age, 0))
+
+
+@app.on_event("startup")
+async def _load_catalog_on_startup():
+    await asyncio.to_thread(load_catalog_cache)
+
+
 @app.get("/api/products", response_model=List[Product])
-async def get_products():
+async def get_products(response: Response, settings: Settings = Depends(get_settings)):
     polar = get_polar_client()
+    cached = _catalog_cache["products"]
 
-    # If no credentials, return mock data
+    # If no credentials, prefer the last catalog we saw over mock data
     if not polar:
         print("ℹ️ No Polar credentials found (env vars).")
+        if cached:
+            print("   Returning last known-good catalog (stale).")
+            _mark_catalog_stale(response)
+            return cached
         print(f"   🔍 Debug: Environment keys visible to process: {list(os.environ.keys())}")
         print("   Returning mock inventory.")
         return products_db
 
-    # Fetch from Polar
-    try:
-        live_products = []
-
-        # List all products from Polar
-        products_response = polar.products.list()
-
-        if products_response and products_response.result:
-            for product in products_response.result.items:
-                # Filter out archived and internal products
-                if getattr(product, 'is_archived', False):
-                    continue
-                name_check = product.name.lower() if product.name else ""
-                if "cart-bundle" in name_check or "cart bundle" in name_check:
-                    continue
-
-                # Determine if this is a subscription product using product-level is_recurring
-                is_subscription = getattr(product, 'is_recurring', False)
-                interval = getattr(product, 'recurring_interval', None)
-                interval_count = getattr(product, 'recurring_interval_count', 1)
-
-                # Get price info from the first price if available
-                price_formatted = "$0.00"
-                if hasattr(product, 'prices') and product.prices:
-                    first_price = product.prices[0]
-                    if hasattr(first_price, 'price_amount'):
-                        price_formatted = f"${first_price.price_amount / 100:.2f}"
-                    # Get interval from price if not set at product level
-                    if not interval and hasattr(first_price, 'recurring_interval'):
-                        interval = first_price.recurring_interval
-                        interval_count = getattr(first_price, 'recurring_interval_count', 1)
-
-                # Determine category from name AND description (keyword matching)
-                name_lower = (product.name or "").lower()
-                desc_lower = (product.description or "").lower()
-                combined_text = name_lower + " " + desc_lower
-
-                # Category detection - based on content keywords (subscription is NOT a category)
-                # Subscription status is tracked via is_subscription field instead
-                if "bundle" in name_lower or "complete" in name_lower or "pack" in name_lower:
-                    category = "bundle"
-                elif any(kw in combined_text for kw in ["math", "arithmetic", "algebra", "geometry", "counting", "multiplication"]):
-                    category = "math"
-                elif any(kw in combined_text for kw in ["read", "phonics", "literacy", "comprehension", "vocabulary"]):
-                    category = "reading"
-                elif any(kw in combined_text for kw in ["science", "biology", "chemistry", "physics", "nature", "experiment"]):
-                    category = "science"
-                elif any(kw in combined_text for kw in ["writ", "composition", "essay", "grammar", "spelling"]):
-                    category = "writing"
-                elif any(kw in combined_text for kw in ["premium", "license", "subscription", "membership"]):
-                    category = "premium"
-                else:
-                    category = "curriculum"
-
-                # Get product images if available (collect all for gallery)
-                images = []
-                image_url = None  # Keep for backwards compatibility
-                if hasattr(product, 'medias') and product.medias:
-                    for media in product.medias:
-                        if hasattr(media, 'public_url') and media.public_url:
-                            images.append(media.public_url)
-                    if images:
-                        image_url = images[0]  # First image for backwards compat
-
-                # Determine hasFiles and isLicenseProduct from benefits array
-                has_files = False
-                is_license_product = False
-                file_count = 0
-                
-                # Debug: Print product attributes to understand SDK structure
-                print(f"\n   🔍 DEBUG: Product '{product.name}' structure:")
-                print(f"      - Type: {type(product)}")
-                print(f"      - Has 'benefits' attr: {hasattr(product, 'benefits')}")
-                
-                # Try to get benefits multiple ways
-                benefits = None
-                if hasattr(product, 'benefits'):
-                    benefits = product.benefits
-                    print(f"      - benefits from attr: {benefits}")
-                elif isinstance(product, dict) and 'benefits' in product:
-                    benefits = product['benefits']
-                    print(f"      - benefits from dict: {benefits}")
-                
-                # If still no benefits, try to list all attributes
-                if benefits is None:
-                    try:
-                        attrs = dir(product) if not isinstance(product, dict) else product.keys()
-                        benefit_related = [a for a in attrs if 'benefit' in str(a).lower()]
-                        print(f"      - Benefit-related attrs: {benefit_related}")
-                    except:
-                        pass
-                
-                if benefits:
-                    print(f"      - Benefits count: {len(benefits)}")
-                    for i, benefit in enumerate(benefits):
-                        # SDK uses TYPE (uppercase), not type
-                        benefit_type = getattr(benefit, 'TYPE', None)
-                        if benefit_type is None:
-                            benefit_type = getattr(benefit, 'type', None)
-                        
-                        print(f"      - Benefit {i}: TYPE={benefit_type}")
-                        
-                        if benefit_type == 'downloadables':
-                            has_files = True
-                            # Count files from benefit properties
-                            props = getattr(benefit, 'properties', None)
-                            if props:
-                                files_list = getattr(props, 'files', None)
-                                if files_list:
-                                    file_count = len(files_list)
-                                    print(f"        - 📁 {file_count} downloadable file(s)")
-                        elif benefit_type == 'license_keys':
-                            is_license_product = True
-                            print(f"        - 🔑 License key product")
-                else:
-                    print(f"      - ⚠️ No benefits found")
-
-                live_products.append({
-                    "id": str(product.id),
-                    "title": product.name or "Unknown Product",
-                    "description": product.description or "No description provided.",
-                    "price": price_formatted,
-                    "image": image_url,  # Single image for backwards compat
-                    "images": images,    # All images for gallery
-                    "category": category,
-                    "purchased": False,
-                    "buyUrl": None,  # Polar uses checkout sessions instead of static URLs
-                    "contentPath": None,
-                    "is_subscription": is_subscription,
-                    "interval": interval,
-                    "interval_count": interval_count,
-                    "hasFiles": has_files,
-                    "fileCount": file_count,  # Number of downloadable files
-                    "isLicenseProduct": is_license_product,
-                    "licenseKey": None,  # Will be populated on sync for purchased products
-                })
-
-            print(f"📦 DEBUG: Fetched {len(live_products)} products from Polar:")
-            for p in live_products:
-                sub_info = f" [SUBSCRIPTION: {p['interval']}]" if p['is_subscription'] else ""
-                files_info = "📁" if p.get('hasFiles') else "📄"
-                license_info = "🔑" if p.get('isLicenseProduct') else ""
-                print(f"   - {p['title']} ({p['category']}){sub_info} {files_info}{license_info} | Images: {len(p.get('images', []))}")
+    if cached:
+        # Serve from memory; a catalog older than CATALOG_MAX_AGE_SECONDS is
+        # flagged stale and refreshed off the request path, so neither a cold
+        # start nor a Polar outage makes the shop wait or fail.
+        if time.time() - _catalog_cache["fetched_at"] >= settings.catalog_max_age_seconds:
+            _mark_catalog_stale(response)
+            _schedule_catalog_refresh(polar)
+        return cached
 
+    # Nothing cached yet (first run on this machine): fetch inline
+    try:
+        live_products = await _refresh_catalog(polar)
+        if live_products:
             return live_products
-
         return products_db  # Fallback if no products found
 
     except Exception as e:
@@ -483,29 +1112,158 @@ async def create_checkout(request: CheckoutRequest):
 
 # ==================== LICENSE VALIDATION ENDPOINT ====================
 
-# Desktop app subscription product ID (for product-specific validation)
-DESKTOP_SUBSCRIPTION_PRODUCT_ID = os.getenv("POLAR_DESKTOP_PRODUCT_ID", "")
-
 class ValidateLicenseRequest(BaseModel):
     license_key: str
     product_id: Optional[str] = None  # If provided, validates license is for this specific product
+    include_token: bool = False  # If true, a valid response carries a signed offline token
 
-@app.post("/api/validate-license")
-async def validate_license(request: ValidateLicenseRequest):
-    """
-    Validate a Polar license key.
-    This endpoint validates license keys using Polar's customer portal API.
-    If product_id is provided, also verifies the license belongs to that specific product.
-    """
-    print(f"🔑 Validating license key: {request.license_key[:8]}...")
-    if request.product_id:
-        print(f"   Product filter: {request.product_id}")
+# Validation outcomes are cached so repeat launches of the desktop app don't
+# each cost a Polar round-trip. Valid results are held for at most
+# LICENSE_CACHE_TTL_SECONDS and never past the license's own expires_at;
+# invalid results only briefly, so a just-purchased key starts working quickly.
+_license_cache = TTLCache(max_entries=10000)
+
+
+def _parse_iso_datetime(value: Optional[str]):
+    from datetime import datetime
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+def _license_cache_key(license_key: str, org_id: str, product_id: Optional[str]) -> str:
+    # Hashed so raw license keys are never held as dictionary keys in memory.
+    raw = f"{license_key}\0{org_id}\0{product_id or ''}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _license_cache_ttl(result: Dict[str, Any]) -> float:
+    """Seconds a validation result may be reused; 0 means don't cache."""
+    settings = get_settings()
+    if not result.get("valid"):
+        return settings.license_negative_cache_ttl_seconds
+    ttl = settings.license_cache_ttl_seconds
+    exp_date = _parse_iso_datetime(result.get("license", {}).get("expiresAt"))
+    if exp_date is not None:
+        from datetime import datetime
+        ttl = min(ttl, (exp_date - datetime.now(exp_date.tzinfo)).total_seconds())
+    return max(ttl, 0)
+
+
+def _build_license_info(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Shape Polar's validated license key into the desktop app's license object."""
+    # Extract customer info
+    customer = data.get("customer") or {}
+
+    # Determine license type based on benefit or default to lifetime
+    license_type = "lifetime"
+    expires_at = data.get("expires_at")
+
+    if expires_at:
+        # Check if it's a subscription based on expiration
+        exp_date = _parse_iso_datetime(expires_at)
+        if exp_date is not None:
+            from datetime import datetime
+            days_til_expiry = (exp_date - datetime.now(exp_date.tzinfo)).days
+            if days_til_expiry <= 35:
+                license_type = "monthly"
+            elif days_til_expiry <= 380:
+                license_type = "yearly"
+
+    return {
+        "type": license_type,
+        "expiresAt": expires_at,
+        "email": customer.get("email", ""),
+        "customerName": customer.get("name", ""),
+        "features": ["premium", "content-updates"]
+    }
+
+
+def _product_mismatch(license_key: str, product_id: Optional[str]):
+    """Return an invalid-license body if the key isn't for product_id, else None."""
+    # If product_id filter is provided, verify the license belongs to that product
+    # Use license key prefix to determine product type since subscription benefits
+    # don't include benefit ID in the validation response
+    if product_id:
+        print(f"   Checking product association via prefix...")
+
+        # Desktop App Subscription keys start with LOHSCD-
+        expected_prefix = "LOHSCD-"
+        if product_id == get_settings().polar_desktop_product_id:
+            if not license_key.upper().startswith(expected_prefix):
+                print(f"   ❌ License key doesn't have expected prefix {expected_prefix}")
+                return {
+                    "success": False,
+                    "valid": False,
+                    "error": f"This license key is for a different product. Desktop App subscription keys start with {expected_prefix}"
+                }
+            print(f"   ✅ License key prefix matches Desktop App subscription")
+        # Add other product prefixes here as needed
+        # e.g., elif product_id == PREMIUM_CONTENT_PRODUCT_ID:
+        #          expected_prefix = "LOL-"
+    return None
+
+
+async def _validate_with_polar(license_key: str, product_id: Optional[str], org_id: str, api_config: Dict[str, Any]):
+    """Ask Polar about one key. Returns (status_code, body); only status 200
+    bodies are definitive answers that may be cached."""
+    headers = {
+        "Accept": "application/json",
+        "Content-Type": "application/json"
+    }
 
+    # Use the customer portal license key validation endpoint
+    # This endpoint doesn't require authentication (public-facing)
+    validate_url = f"{api_config['base_url']}/v1/customer-portal/license-keys/validate"
+
+    payload = {
+        "key": license_key,
+        "organization_id": org_id
+    }
+
+    print(f"   Calling: {validate_url}")
+
+    response = await get_polar_http().post(validate_url, json=payload, headers=headers)
+
+    print(f"   Response Status: {response.status_code}")
+
+    if response.status_code == 200:
+        data = response.json()
+        print(f"   ✅ License key is valid")
+
+        mismatch = _product_mismatch(license_key, product_id)
+        if mismatch:
+            return 200, mismatch
+
+        return 200, {
+            "success": True,
+            "valid": True,
+            "license": _build_license_info(data)
+        }
+    elif response.status_code == 404 or response.status_code == 422:
+        print(f"   ❌ Invalid license key")
+        return 200, {"success": False, "valid": False, "error": "Invalid license key"}
+    else:
+        error_text = response.text[:200] if response.text else "Unknown error"
+        print(f"   ❌ Validation failed: {error_text}")
+        return 502, {"success": False, "valid": False, "error": "License validation failed"}
+
+
+async def _check_license(license_key: str, product_id: Optional[str] = None):
+    """Validate one license key, consulting the result cache first.
+
+    Returns (status_code, body). A 502 status is an upstream failure that the
+    endpoint still reports as a normal (uncached) "validation failed" body.
+    """
     # Test license bypass — set TEST_LICENSE_KEY in .env to enable production testing
-    test_key = os.getenv("TEST_LICENSE_KEY", "")
-    if test_key and request.license_key == test_key:
+    settings = get_settings()
+    test_key = settings.test_license_key
+    if test_key and license_key == test_key:
         print(f"   ✅ Test license key matched — bypassing Polar validation")
-        return {
+        return 200, {
             "success": True,
             "valid": True,
             "license": {
@@ -518,293 +1276,1462 @@ async def validate_license(request: ValidateLicenseRequest):
         }
 
     api_config = get_polar_api_config()
-    
+
     if not api_config['token']:
         print("❌ Error: Polar credentials not configured")
-        return JSONResponse(status_code=500, content={"error": "License validation not configured"})
+        return 500, {"error": "License validation not configured"}
 
     # Get organization ID from env
-    org_id = os.getenv("POLAR_ORGANIZATION_ID")
+    org_id = settings.polar_organization_id
     if not org_id:
         print("❌ Error: POLAR_ORGANIZATION_ID not set")
-        return JSONResponse(status_code=500, content={"error": "License validation not configured"})
+        return 500, {"error": "License validation not configured"}
+
+    cache_key = _license_cache_key(license_key, org_id, product_id)
+    cached = _license_cache.get(cache_key)
+    if cached is not None:
+        print(f"   ⚡ Served from license cache ({'valid' if cached.get('valid') else 'invalid'})")
+        return 200, cached
+
+    # Keys present in the local replica are answered without calling Polar;
+    # only keys it has never seen (e.g. bought since the last sync) go upstream.
+    local = await asyncio.to_thread(_validate_from_replica, license_key, product_id)
+    if local is not None:
+        print(f"   ⚡ Served from license key replica ({'valid' if local.get('valid') else 'invalid'})")
+        return 200, local
+
+    async def fetch():
+        status_code, body = await _validate_with_polar(license_key, product_id, org_id, api_config)
+        if status_code == 200:
+            ttl = _license_cache_ttl(body)
+            if ttl > 0:
+                _license_cache.set(cache_key, body, ttl)
+        return status_code, body
+
+    # Concurrent checks of the same key (e.g. app relaunch loops) share one call
+    return await _upstream_flights.do(("license", cache_key), fetch, timeout=35.0)
+
+
+@app.post("/api/validate-license")
+async def validate_license(request: ValidateLicenseRequest):
+    """
+    Validate a Polar license key.
+    This endpoint validates license keys using Polar's customer portal API.
+    If product_id is provided, also verifies the license belongs to that specific product.
+    """
+    print(f"🔑 Validating license key: {request.license_key[:8]}...")
+    if request.product_id:
+        print(f"   Product filter: {request.product_id}")
 
     try:
-        headers = {
-            "Accept": "application/json",
-            "Content-Type": "application/json"
-        }
-        
-        # Use the customer portal license key validation endpoint
-        # This endpoint doesn't require authentication (public-facing)
-        validate_url = f"{api_config['base_url']}/v1/customer-portal/license-keys/validate"
-        
-        payload = {
-            "key": request.license_key,
-            "organization_id": org_id
-        }
-        
-        print(f"   Calling: {validate_url}")
-        
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(validate_url, json=payload, headers=headers)
-            
-            print(f"   Response Status: {response.status_code}")
-            
-            if response.status_code == 200:
-                data = response.json()
-                print(f"   ✅ License key is valid")
-                
-                # If product_id filter is provided, verify the license belongs to that product
-                # Use license key prefix to determine product type since subscription benefits 
-                # don't include benefit ID in the validation response
-                if request.product_id:
-                    print(f"   Checking product association via prefix...")
-                    
-                    # Desktop App Subscription keys start with LOHSCD-
-                    expected_prefix = "LOHSCD-"
-                    if request.product_id == DESKTOP_SUBSCRIPTION_PRODUCT_ID:
-                        if not request.license_key.upper().startswith(expected_prefix):
-                            print(f"   ❌ License key doesn't have expected prefix {expected_prefix}")
-                            return {
-                                "success": False, 
-                                "valid": False, 
-                                "error": f"This license key is for a different product. Desktop App subscription keys start with {expected_prefix}"
-                            }
-                        print(f"   ✅ License key prefix matches Desktop App subscription")
-                    # Add other product prefixes here as needed
-                    # e.g., elif request.product_id == PREMIUM_CONTENT_PRODUCT_ID:
-                    #          expected_prefix = "LOL-"
-                
-                # Extract customer info
-                customer = data.get("customer", {})
-                benefit = data.get("benefit", {})
-                
-                # Determine license type based on benefit or default to lifetime
-                license_type = "lifetime"
-                expires_at = data.get("expires_at")
-                
-                if expires_at:
-                    # Check if it's a subscription based on expiration
-                    from datetime import datetime
-                    try:
-                        exp_date = datetime.fromisoformat(expires_at.replace("Z", "+00:00"))
-                        now = datetime.now(exp_date.tzinfo)
-                        days_til_expiry = (exp_date - now).days
-                        if days_til_expiry <= 35:
-                            license_type = "monthly"
-                        elif days_til_expiry <= 380:
-                            license_type = "yearly"
-                    except:
-                        pass
-                
-                return {
-                    "success": True,
-                    "valid": True,
-                    "license": {
-                        "type": license_type,
-                        "expiresAt": expires_at,
-                        "email": customer.get("email", ""),
-                        "customerName": customer.get("name", ""),
-                        "features": ["premium", "content-updates"]
-                    }
+        status_code, body = await _check_license(request.license_key, request.product_id)
+    except Exception as e:
+        print(f"❌ Error validating license: {e}")
+        import traceback
+        traceback.print_exc()
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+    if status_code == 500:
+        return JSONResponse(status_code=500, content=body)
+    if request.include_token and body.get("valid"):
+        token = _issue_license_token(request.license_key, request.product_id, body["license"])
+        if token:
+            # Copy: body may be the shared cached result
+            body = {**body, **token}
+    return body
+
+
+# Support staff auditing keys and multi-seat installs check many keys at once.
+# Keys are validated concurrently over the shared Polar connection pool, with
+# at most LICENSE_BATCH_CONCURRENCY Polar calls in flight per batch.
+
+class ValidateLicensesRequest(BaseModel):
+    license_keys: List[str]
+    product_id: Optional[str] = None  # Applied to every key, as in ValidateLicenseRequest
+
+
+@app.post("/api/validate-licenses")
+async def validate_licenses(request: ValidateLicensesRequest, settings: Settings = Depends(get_settings)):
+    """Validate up to MAX_BATCH_LICENSE_KEYS keys in one call.
+
+    Results come back in input order, each shaped like a /api/validate-license
+    response plus its "index" in the request.
+    """
+    keys = request.license_keys
+    if len(keys) > settings.max_batch_license_keys:
+        return JSONResponse(status_code=400, content={
+            "error": f"Too many license keys (max {settings.max_batch_license_keys} per request)"
+        })
+
+    print(f"🔑 Batch validating {len(keys)} license key(s)")
+    semaphore = asyncio.Semaphore(settings.license_batch_concurrency)
+
+    async def check(key: str):
+        async with semaphore:
+            try:
+                return await _check_license(key, request.product_id)
+            except Exception as e:
+                print(f"❌ Error validating license {key[:8]}...: {e}")
+                return 502, {"success": False, "valid": False, "error": "License validation failed"}
+
+    outcomes = await asyncio.gather(*(check(key) for key in keys))
+
+    # A 500 here is a server configuration problem, identical for every key
+    for status_code, body in outcomes:
+        if status_code == 500:
+            return JSONResponse(status_code=500, content=body)
+
+    results = [{"index": i, **body} for i, (_, body) in enumerate(outcomes)]
+    valid_count = sum(1 for r in results if r.get("valid"))
+    print(f"   ✅ {valid_count}/{len(results)} valid")
+    return {"success": True, "results": results, "count": len(results), "validCount": valid_count}
+
+
+# ==================== OFFLINE LICENSE TOKENS ====================
+# Env vars used:
+#   LICENSE_TOKEN_PRIVATE_KEY        base64url raw 32-byte Ed25519 private key. Generate with:
+#       python -c "import base64,os;print(base64.urlsafe_b64encode(os.urandom(32)).decode())"
+#   LICENSE_TOKEN_REFRESH_SECONDS    when clients should come back for a new token (default 3 days)
+#   LICENSE_TOKEN_MAX_AGE_SECONDS    hard offline limit for lifetime licenses (default 30 days)
+#
+# A token is "v1.<payload>.<signature>", both parts base64url without padding.
+# The desktop app verifies the Ed25519 signature with the public key from
+# /api/license/public-key (shipping a public key is safe, unlike an HMAC
+# secret), and only calls /api/license/refresh once refreshAfter has passed.
+
+try:
+    from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+    from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
+except ImportError:
+    Ed25519PrivateKey = None
+
+import base64
+
+_license_signer: Dict[str, Any] = {"raw": None, "key": None}
+
+
+def _b64url_encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64url_decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _license_signing_key():
+    """Return the Ed25519 private key, or None if tokens are not configured."""
+    raw = get_settings().license_token_private_key
+    if not raw or Ed25519PrivateKey is None:
+        return None
+    if _license_signer["raw"] != raw:
+        try:
+            _license_signer["key"] = Ed25519PrivateKey.from_private_bytes(_b64url_decode(raw))
+        except Exception as e:
+            print(f"⚠️ LICENSE_TOKEN_PRIVATE_KEY is invalid: {e}")
+            _license_signer["key"] = None
+        _license_signer["raw"] = raw
+    return _license_signer["key"]
+
+
+def _license_subject(license_key: str) -> str:
+    return hashlib.sha256(license_key.encode()).hexdigest()[:32]
+
+
+def _issue_license_token(license_key: str, product_id: Optional[str], license_info: Dict[str, Any]):
+    """Sign a token for a validated license. Returns the response fields to add
+    ({"token", "refreshAfter"}) or None when signing isn't configured."""
+    signing_key = _license_signing_key()
+    if signing_key is None:
+        return None
+
+    settings = get_settings()
+    now = int(time.time())
+    expires = now + settings.license_token_max_age_seconds
+    exp_date = _parse_iso_datetime(license_info.get("expiresAt"))
+    if exp_date is not None:
+        expires = min(expires, int(exp_date.timestamp()))
+    refresh_after = min(now + settings.license_token_refresh_seconds, expires)
+
+    claims = {
+        "v": 1,
+        "sub": _license_subject(license_key),
+        "productId": product_id,
+        "type": license_info.get("type"),
+        "expiresAt": license_info.get("expiresAt"),
+        "features": license_info.get("features", []),
+        "iat": now,
+        "refreshAfter": refresh_after,
+        "exp": expires,
+    }
+    signing_input = "v1." + _b64url_encode(json.dumps(claims, separators=(",", ":")).encode())
+    signature = signing_key.sign(signing_input.encode())
+    return {"token": f"{signing_input}.{_b64url_encode(signature)}", "refreshAfter": refresh_after}
+
+
+def _verify_license_token(token: str):
+    """Return the token's claims if its signature verifies, else None."""
+    signing_key = _license_signing_key()
+    if signing_key is None or not token:
+        return None
+    try:
+        version, payload, signature = token.split(".")
+        if version != "v1":
+            return None
+        signing_key.public_key().verify(_b64url_decode(signature), f"{version}.{payload}".encode())
+        return json.loads(_b64url_decode(payload))
+    except Exception:
+        return None
+
+
+@app.get("/api/license/public-key")
+async def license_public_key():
+    """Public half of the token signing key, for clients that verify tokens."""
+    signing_key = _license_signing_key()
+    if signing_key is None:
+        return JSONResponse(status_code=503, content={"error": "Offline license tokens not configured"})
+    public_raw = signing_key.public_key().public_bytes(Encoding.Raw, PublicFormat.Raw)
+    return {"alg": "Ed25519", "publicKey": _b64url_encode(public_raw)}
+
+
+class LicenseRefreshRequest(BaseModel):
+    license_key: str
+    product_id: Optional[str] = None
+    token: Optional[str] = None  # The client's current token, if it has one
+
+
+@app.post("/api/license/refresh")
+async def refresh_license_token(request: LicenseRefreshRequest):
+    """Return a fresh offline token for a license key.
+
+    A still-valid token that hasn't reached its refresh window is handed back
+    unchanged without contacting Polar, so over-eager clients stay cheap.
+    """
+    if _license_signing_key() is None:
+        return JSONResponse(status_code=503, content={"error": "Offline license tokens not configured"})
+
+    claims = _verify_license_token(request.token or "")
+    now = time.time()
+    if (claims and claims.get("sub") == _license_subject(request.license_key)
+            and claims.get("productId") == request.product_id
+            and now < claims.get("refreshAfter", 0) and now < claims.get("exp", 0)):
+        return {"success": True, "valid": True, "token": request.token,
+                "refreshAfter": claims["refreshAfter"], "refreshed": False}
+
+    print(f"🔑 Refreshing license token: {request.license_key[:8]}...")
+    try:
+        status_code, body = await _check_license(request.license_key, request.product_id)
+    except Exception as e:
+        print(f"❌ Error refreshing license token: {e}")
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+    if status_code == 500:
+        return JSONResponse(status_code=500, content=body)
+    if not body.get("valid"):
+        return body
+    token = _issue_license_token(request.license_key, request.product_id, body["license"])
+    return {**body, **token, "refreshed": True}
+
+
+# ==================== LICENSE KEY REPLICA ====================
+# A local SQLite copy of the organization's license keys, refreshed in the
+# background from polar.license_keys.list(). /api/validate-license answers
+# known keys from it, so validation stays fast and keeps working while Polar
+# is slow or unreachable. Rows are keyed by SHA-256 of the key; raw keys are
+# never written to disk.
+#
+# Env vars used:
+#   LICENSE_REPLICA_SYNC_SECONDS      interval between syncs (default 600)
+#   LICENSE_REPLICA_MAX_AGE_SECONDS   stop trusting the replica this long after
+#                                     the last successful sync (default 3 days)
+
+import sqlite3
+
+LICENSE_REPLICA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "license_keys.db")
+
+_license_replica_task: Optional[asyncio.Task] = None
+
+
+def _replica_connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(LICENSE_REPLICA_FILE, timeout=10.0)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _init_license_replica():
+    """Create the replica's schema if missing. Run once, at startup; WAL
+    mode is persistent, so later connections skip all of this. Blocking."""
+    conn = _replica_connect()
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS license_keys (
+                key_hash TEXT PRIMARY KEY,
+                id TEXT,
+                status TEXT,
+                customer_id TEXT,
+                customer_email TEXT,
+                customer_name TEXT,
+                benefit_id TEXT,
+                expires_at TEXT,
+                limit_activations INTEGER,
+                usage INTEGER,
+                limit_usage INTEGER,
+                synced_at REAL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS license_keys_customer ON license_keys (customer_id)")
+        conn.execute("CREATE TABLE IF NOT EXISTS replica_meta (name TEXT PRIMARY KEY, value TEXT)")
+    finally:
+        conn.close()
+
+
+def _license_key_hash(license_key: str) -> str:
+    return hashlib.sha256(license_key.encode()).hexdigest()
+
+
+def _iso_or_none(value) -> Optional[str]:
+    if value is None:
+        return None
+    return value.isoformat() if hasattr(value, "isoformat") else str(value)
+
+
+def sync_license_replica(polar, org_id: str) -> int:
+    """Replace the replica with Polar's current license keys. Blocking."""
+    synced_at = time.time()
+    rows = []
+    for lk in _iter_polar_items(polar.license_keys.list(organization_id=org_id, limit=100)):
+        key_value = getattr(lk, "key", None)
+        if not key_value:
+            continue
+        customer = getattr(lk, "customer", None)
+        status = getattr(lk, "status", None)
+        rows.append((
+            _license_key_hash(key_value),
+            str(getattr(lk, "id", "")),
+            str(getattr(status, "value", status) or ""),
+            str(getattr(lk, "customer_id", "") or ""),
+            getattr(customer, "email", None) or "",
+            getattr(customer, "name", None) or "",
+            str(getattr(lk, "benefit_id", "") or ""),
+            _iso_or_none(getattr(lk, "expires_at", None)),
+            getattr(lk, "limit_activations", None),
+            getattr(lk, "usage", None),
+            getattr(lk, "limit_usage", None),
+            synced_at,
+        ))
+
+    conn = _replica_connect()
+    try:
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO license_keys VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+            )
+            # Keys that disappeared upstream must not stay valid locally
+            conn.execute("DELETE FROM license_keys WHERE synced_at < ?", (synced_at,))
+            conn.execute(
+                "INSERT OR REPLACE INTO replica_meta VALUES ('last_sync', ?)", (str(synced_at),)
+            )
+    finally:
+        conn.close()
+    return len(rows)
+
+
+def _validate_from_replica(license_key: str, product_id: Optional[str]):
+    """Answer a validation from the replica, or None if it can't (unknown key,
+    key with activation or usage limits, replica missing or too old). Blocking."""
+    if not os.path.exists(LICENSE_REPLICA_FILE):
+        return None
+    try:
+        conn = _replica_connect()
+        try:
+            meta = conn.execute("SELECT value FROM replica_meta WHERE name = 'last_sync'").fetchone()
+            max_age = get_settings().license_replica_max_age_seconds
+            if not meta or time.time() - float(meta["value"]) > max_age:
+                return None
+            row = conn.execute(
+                "SELECT * FROM license_keys WHERE key_hash = ?", (_license_key_hash(license_key),)
+            ).fetchone()
+        finally:
+            conn.close()
+    except Exception as e:
+        print(f"⚠️ License replica lookup failed: {e}")
+        return None
+
+    if row is None:
+        return None
+    # Activations and usage move between syncs; only Polar knows the
+    # current counts, so limited keys always take the live check
+    if row["limit_activations"] is not None or row["limit_usage"] is not None:
+        return None
+
+    exp_date = _parse_iso_datetime(row["expires_at"])
+    expired = False
+    if exp_date is not None:
+        from datetime import datetime
+        expired = exp_date <= datetime.now(exp_date.tzinfo)
+    if row["status"] != "granted" or expired:
+        return {"success": False, "valid": False, "error": "Invalid license key"}
+
+    mismatch = _product_mismatch(license_key, product_id)
+    if mismatch:
+        return mismatch
+
+    return {
+        "success": True,
+        "valid": True,
+        "license": _build_license_info({
+            "customer": {"email": row["customer_email"], "name": row["customer_name"]},
+            "expires_at": row["expires_at"],
+        })
+    }
+
+
+async def _license_replica_loop():
+    while True:
+        polar = get_polar_client()
+        org_id = get_settings().polar_organization_id
+        if polar and org_id:
+            try:
+                count = await asyncio.to_thread(sync_license_replica, polar, org_id)
+                print(f"🔑 License key replica synced: {count} key(s)")
+            except Exception as e:
+                print(f"⚠️ License key replica sync failed, keeping previous copy: {e}")
+        await asyncio.sleep(get_settings().license_replica_sync_seconds)
+
+
+@app.on_event("startup")
+async def _start_license_replica():
+    global _license_replica_task
+    try:
+        await asyncio.to_thread(_init_license_replica)
+    except Exception as e:
+        print(f"⚠️ License key replica unavailable: {e}")
+        return
+    _license_replica_task = asyncio.create_task(_license_replica_loop())
+
+
+@app.on_event("shutdown")
+async def _stop_license_replica():
+    if _license_replica_task is not None:
+        _license_replica_task.cancel()
+
+
+# ==================== SYNC ENDPOINT ====================
+# The customer lookup gates the rest of a sync; the products listing doesn't
+# depend on it and starts straight away, and once the customer is known their
+# orders and license keys are fetched concurrently. Everything shares one
+# SYNC_DEADLINE_SECONDS budget (default 15). If the products or license key
+# fetch fails or runs out of time, purchases are still returned, with
+# "partial": true and the missing parts listed, rather than failing the sync.
+#
+# Each response carries an opaque "cursor". Sent back, it limits "purchases"
+# to orders created or changed since, and orders whose license key changed
+# since. "fullResync": true marks a response holding everything: the client
+# sent no cursor, or it was unreadable, for another customer, older than
+# SYNC_CURSOR_MAX_AGE_SECONDS (default 30 days), or the customer now has
+# fewer orders than when it was issued.
+
+class SyncRequest(BaseModel):
+    email: str
+    cursor: Optional[str] = None  # From the previous sync's response
+
+
+def _changed_at(obj) -> float:
+    """Epoch seconds of the later of an SDK model's or API dict's
+    created_at/modified_at; 0 if neither is known."""
+    latest = 0.0
+    for field in ("created_at", "modified_at"):
+        value = obj.get(field) if isinstance(obj, dict) else getattr(obj, field, None)
+        if isinstance(value, str):
+            value = _parse_iso_datetime(value)
+        if value is not None and hasattr(value, "timestamp"):
+            latest = max(latest, value.timestamp())
+    return latest
+
+
+def _encode_sync_cursor(customer_id: str, orders_mark: float, keys_mark: float, order_count: int) -> str:
+    claims = {"v": 1, "c": customer_id, "o": orders_mark, "k": keys_mark, "n": order_count,
+              "iat": int(time.time())}
+    return _b64url_encode(json.dumps(claims, separators=(",", ":")).encode())
+
+
+def _decode_sync_cursor(cursor: Optional[str], customer_id: str) -> Optional[Dict[str, Any]]:
+    """The cursor's claims if it can be used for this customer, else None."""
+    if not cursor:
+        return None
+    try:
+        claims = json.loads(_b64url_decode(cursor))
+    except Exception:
+        return None
+    if not isinstance(claims, dict) or claims.get("v") != 1 or claims.get("c") != customer_id:
+        return None
+    if not all(isinstance(claims.get(field), (int, float)) for field in ("o", "k", "n", "iat")):
+        return None
+    if time.time() - claims.get("iat", 0) > get_settings().sync_cursor_max_age_seconds:
+        return None
+    return claims
+
+
+def _benefit_product_map(polar) -> Dict[str, Dict[str, Any]]:
+    """benefit_id -> product info, to tell which product a license key is for."""
+    benefit_to_product = {}
+    for prod in _iter_polar_items(polar.products.list(limit=100)):
+        for benefit in getattr(prod, 'benefits', None) or []:
+            benefit_id = str(getattr(benefit, 'id', ''))
+            benefit_type = getattr(benefit, 'TYPE', None) or getattr(benefit, 'type', None)
+            if benefit_id:
+                benefit_to_product[benefit_id] = {
+                    'product_id': str(prod.id),
+                    'product_name': prod.name,
+                    'benefit_type': benefit_type
                 }
-            elif response.status_code == 404 or response.status_code == 422:
-                print(f"   ❌ Invalid license key")
-                return {"success": False, "valid": False, "error": "Invalid license key"}
-            else:
-                error_text = response.text[:200] if response.text else "Unknown error"
-                print(f"   ❌ Validation failed: {error_text}")
-                return {"success": False, "valid": False, "error": "License validation failed"}
-                
+    return benefit_to_product
+
+
+def _customer_orders(polar, customer_id: str) -> List[Any]:
+    return list(_iter_polar_items(polar.orders.list(customer_id=customer_id, limit=100)))
+
+
+async def _customer_license_keys(customer_id: str) -> List[Dict[str, Any]]:
+    """The customer's license keys, from the Customer Portal API, so only
+    their keys are listed rather than the whole organization's."""
+    api_config = get_polar_api_config()
+    url = f"{api_config['base_url']}/v1/customer-portal/license-keys/"
+    items: List[Dict[str, Any]] = []
+    page = 1
+    renewed = False
+    while True:
+        token = await _customer_session_token(customer_id)
+        resp = await get_polar_http().get(
+            url, params={"page": page, "limit": 100}, follow_redirects=True,
+            headers={"Authorization": f"Bearer {token}", "Accept": "application/json"},
+        )
+        if resp.status_code == 401 and not renewed:
+            # The cached session was revoked or expired early: start a new one
+            _customer_sessions.pop(customer_id)
+            renewed = True
+            continue
+        if resp.status_code != 200:
+            raise RuntimeError(f"license keys returned {resp.status_code}: {resp.text[:200]}")
+        data = resp.json()
+        items.extend(data.get("items", []))
+        if page >= data.get("pagination", {}).get("max_page", 1):
+            return items
+        page += 1
+
+
+def _in_background(func, *args) -> asyncio.Task:
+    """Run a blocking call in a thread as a task whose failure is only
+    observed if someone awaits it."""
+    task = asyncio.ensure_future(asyncio.to_thread(func, *args))
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    return task
+
+
+@app.post("/api/sync-purchases")
+async def sync_purchases(request: SyncRequest, settings: Settings = Depends(get_settings)):
+    polar = get_polar_client()
+
+    if not polar:
+        return {"success": False, "error": "API misconfigured"}
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.sync_deadline_seconds
+
+    def remaining():
+        return max(deadline - loop.time(), 0)
+
+    try:
+        results = []
+        missing = []
+
+        # Independent of the customer, so it overlaps the lookup below
+        products_task = _in_background(_benefit_product_map, polar)
+
+        # Find customer by email
+        customer_id = await asyncio.wait_for(
+            asyncio.to_thread(_find_customer_id, polar, request.email), remaining()
+        )
+        if not customer_id:
+            print(f"ℹ️ No customer found with email: {request.email}")
+            return {"success": True, "purchases": [], "count": 0, "fullResync": True}
+        print(f"✅ Found customer: {customer_id} for email: {request.email}")
+
+        orders_task = _in_background(_customer_orders, polar, customer_id)
+        keys_task = asyncio.ensure_future(_customer_license_keys(customer_id))
+        keys_task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        await asyncio.wait({products_task, orders_task, keys_task}, timeout=remaining())
+
+        if not orders_task.done():
+            print(f"❌ Timed out fetching orders for {request.email}")
+            keys_task.cancel()
+            return {"success": False, "error": "Timed out fetching purchases"}
+        orders = orders_task.result()
+
+        # Map license keys to products via their benefit
+        license_keys_by_product = {}  # product_id -> license_key
+        key_changed_by_product = {}  # product_id -> when that key last changed
+        keys_mark = None  # newest license key change seen, if keys were fetched
+        benefit_to_product = None
+        if products_task.done() and not products_task.exception():
+            benefit_to_product = products_task.result()
+            print(f"\n   📋 Built benefit->product map: {len(benefit_to_product)} benefits")
+        else:
+            print(f"⚠️ Could not build benefit->product map: "
+                  f"{products_task.exception() if products_task.done() else 'timed out'}")
+            missing.append("products")
+
+        if not keys_task.done() or keys_task.exception():
+            print(f"⚠️ Could not fetch license keys: "
+                  f"{keys_task.exception() if keys_task.done() else 'timed out'}")
+            keys_task.cancel()
+            missing.append("licenseKeys")
+        elif benefit_to_product is not None:
+            keys_mark = 0.0
+            for lk in keys_task.result():
+                keys_mark = max(keys_mark, _changed_at(lk))
+                key_value = lk.get("key")
+                benefit_id = str(lk.get("benefit_id") or "")
+                print(f"\n   🔑 Found license key: {key_value[:12] if key_value else 'N/A'}...")
+                if benefit_id in benefit_to_product and key_value:
+                    prod_info = benefit_to_product[benefit_id]
+                    license_keys_by_product[prod_info['product_id']] = key_value
+                    key_changed_by_product[prod_info['product_id']] = _changed_at(lk)
+                    print(f"      - ✅ Mapped to product: {prod_info['product_name']} (id: {prod_info['product_id']})")
+                else:
+                    print(f"      - ⚠️ No product mapping found for this benefit")
+            print(f"\n   📊 License keys by product: {len(license_keys_by_product)}")
+        else:
+            missing.append("licenseKeys")
+
+        cached_entitlements = _entitlements.get(customer_id)
+        if cached_entitlements is not None and not \
+                {pid for pid in map(_order_product_id, orders) if pid} <= cached_entitlements[0]:
+            invalidate_entitlements(customer_id)  # Bought something since they were loaded
+
+        since = _decode_sync_cursor(request.cursor, customer_id)
+        full_resync = since is None or len(orders) < since.get("n", 0)
+        orders_mark = max((_changed_at(order) for order in orders), default=0.0)
+        if since and keys_mark is None:
+            # Keys weren't fetched: keep the old mark so their changes come next time
+            keys_mark = since.get("k", 0.0)
+
+        for order in orders:
+            product = order.product if hasattr(order, 'product') else None
+            product_id = str(product.id) if product and hasattr(product, 'id') else str(getattr(order, 'product_id', ''))
+            product_name = product.name if product and hasattr(product, 'name') else "Unknown"
+
+            # Note: order.product typically doesn't include full benefits info
+            # hasFiles and isLicenseProduct should come from /api/products, not sync
+            # We only try to match license keys here
+            has_files = None  # None = use value from products API
+            is_license_product = None  # None = use value from products API
+
+            print(f"\n   🔍 Processing order for: {product_name} (id: {product_id})")
+
+            # Try to get benefits if available on order.product
+            if product and hasattr(product, 'benefits') and product.benefits:
+                for benefit in product.benefits:
+                    benefit_type = getattr(benefit, 'TYPE', None) or getattr(benefit, 'type', None)
+                    if benefit_type == 'downloadables':
+                        has_files = True
+                    elif benefit_type == 'license_keys':
+                        is_license_product = True
+
+            if not full_resync and _changed_at(order) <= since["o"] \
+                    and key_changed_by_product.get(product_id, 0.0) <= since["k"]:
+                continue  # The client already has this one
+
+            # Try to find a license key for this product (via product_id lookup)
+            license_key = license_keys_by_product.get(product_id)
+            if license_key:
+                is_license_product = True  # Override since we found a key
+                print(f"      - ✅ Found license key for this product!")
+
+            results.append({
+                "productId": product_id,
+                "variantId": None,
+                "productName": product_name,
+                "orderId": str(order.id),
+                "hasFiles": has_files,  # None = frontend should use products API value
+                "isLicenseProduct": is_license_product,  # None = frontend should use products API value
+                "licenseKey": license_key,
+            })
+
+        print(f"📦 Found {len(results)} {'' if full_resync else 'changed '}purchases for {request.email}")
+        for r in results:
+            files_info = "📁 Has files" if r.get('hasFiles') else "📄 No files"
+            key_info = f"🔑 {r.get('licenseKey', '')[:8]}..." if r.get('licenseKey') else "🔓 No key"
+            print(f"   - {r['productName']}: {files_info} | {key_info}")
+
+        response = {
+            "success": True,
+            "purchases": results,
+            "count": len(results),
+            "partial": bool(missing),
+            "fullResync": full_resync,
+            "cursor": _encode_sync_cursor(customer_id, orders_mark, keys_mark or 0.0, len(orders)),
+        }
+        if missing:
+            response["missing"] = missing
+        return response
+
+    except asyncio.TimeoutError:
+        print(f"❌ Timed out syncing purchases for {request.email}")
+        return {"success": False, "error": "Timed out looking up customer"}
+    except Exception as e:
+        print(f"❌ Error syncing purchases: {e}")
+        import traceback
+        traceback.print_exc()
+        return {"success": False, "error": str(e)}
+
+
+# ==================== DOWNLOAD ENDPOINT ====================
+
+def log_file_details(file_obj, prefix=""):
+    """Helper to log detailed file object info for Polar downloads"""
+    print(f"{prefix}📄 FILE OBJECT DETAILS:")
+    print(f"{prefix}   ├─ id: {getattr(file_obj, 'id', 'unknown')}")
+    print(f"{prefix}   ├─ name: {getattr(file_obj, 'name', 'unknown')}")
+    print(f"{prefix}   ├─ size: {getattr(file_obj, 'size', 'unknown')} bytes")
+    print(f"{prefix}   ├─ checksum_sha256: {getattr(file_obj, 'checksum_sha256', 'N/A')}")
+    download_url = getattr(file_obj, 'download_url', None)
+    if download_url and len(download_url) > 80:
+        download_url = download_url[:80] + "..."
+    print(f"{prefix}   └─ download_url: {download_url}")
+
+
+# Presigned file URLs need no auth, so downloads use their own pool rather than
+# the Polar API one (and follow the storage redirects).
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+_download_http: Optional[httpx.AsyncClient] = None
+
+
+def get_download_http() -> httpx.AsyncClient:
+    global _download_http
+    if _download_http is None or _download_http.is_closed:
+        _download_http = httpx.AsyncClient(
+            follow_redirects=True,
+            timeout=httpx.Timeout(60.0, read=300.0),
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+        )
+    return _download_http
+
+
+@app.on_event("shutdown")
+async def _close_download_http():
+    if _download_http is not None:
+        await _download_http.aclose()
+
+
+def _content_disposition(filename: str) -> str:
+    from urllib.parse import quote
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+
+# Content-addressed cache of Polar downloadable files, keyed by the SHA-256
+# Polar reports for each file, so popular products are served from the Pi's
+# disk instead of re-proxied from Polar's storage on every download. The
+# budget is FILE_CACHE_MAX_MB (default 2048).
+_file_cache = DiskCache(
+    os.path.join(CACHE_ROOT, "files"),
+    max_bytes=lambda: get_settings().file_cache_max_mb * 1024 * 1024,
+)
+_file_fills: Dict[str, _CacheFill] = {}  # checksum -> its in-progress fetch
+# checksum -> resolved once the fetch that will fill it has its headers
+_file_pending: Dict[str, asyncio.Future] = {}
+
+
+def _file_checksum(file_obj: Dict[str, Any]) -> Optional[str]:
+    """The file's lowercase hex SHA-256, if Polar gave us a well-formed one."""
+    import re
+    checksum = (file_obj.get("checksum_sha256") or "").lower()
+    return checksum if re.fullmatch(r"[0-9a-f]{64}", checksum) else None
+
+
+async def _proxy_download(url: str, filename: str, media_type: str, range_header: Optional[str] = None,
+                          if_range: Optional[str] = None, cache_as: Optional[Dict[str, Any]] = None):
+    """Stream an upstream file straight through to the client.
+
+    Nothing is buffered in memory: each upstream chunk is forwarded as it
+    arrives, so the client starts receiving on the first chunk. A client
+    Range header (with its If-Range, if any) is passed upstream and a 206
+    answer (with its Content-Range) is relayed, so interrupted downloads can
+    resume. With ``cache_as``, a full 200 body is instead written into the
+    file cache by a _CacheFill and streamed from there.
+    """
+    client = get_download_http()
+    headers = {}
+    if range_header:
+        headers["Range"] = range_header
+        # Upstream then sends the whole file if it changed since the client's copy
+        if if_range:
+            headers["If-Range"] = if_range
+    upstream = await client.send(client.build_request("GET", url, headers=headers), stream=True)
+    print(f"   Upstream Response Status: {upstream.status_code}")
+    print(f"   Content-Type: {upstream.headers.get('content-type')}")
+
+    if upstream.status_code not in (200, 206):
+        error_text = (await upstream.aread())[:500]
+        await upstream.aclose()
+        print(f"   ❌ DOWNLOAD FAILED! Response: {error_text!r}")
+        return JSONResponse(
+            status_code=upstream.status_code,
+            content={"error": f"Upstream download failed: {upstream.status_code}"}
+        )
+
+    # Raw passthrough, so the length and encoding upstream reports stay true
+    passthrough = {}
+    for name in ("content-length", "content-range", "content-encoding", "etag", "last-modified"):
+        if name in upstream.headers:
+            passthrough[name.title()] = upstream.headers[name]
+
+    async def body():
+        try:
+            async for chunk in upstream.aiter_raw(DOWNLOAD_CHUNK_SIZE):
+                yield chunk
+        finally:
+            await upstream.aclose()
+
+    # A complete, unencoded 200 body is exactly the file, so it can fill the cache
+    if cache_as and upstream.status_code == 200 and "content-encoding" not in upstream.headers:
+        checksum = cache_as["checksum"]
+        fill = _file_fills.get(checksum)
+        if fill is not None:
+            # Another request started the same fill while this one waited on headers
+            print(f"   ⏳ Following in-progress fetch of {checksum[:16]}...")
+            await upstream.aclose()
+        else:
+            fill = _CacheFill(_file_cache, checksum, body(), _file_fills, expected_sha256=checksum,
+                              expected_size=cache_as.get("size"), headers=passthrough)
+        return _follow_file_fill(fill, filename, media_type)
+
+    return StreamingResponse(
+        body(),
+        status_code=upstream.status_code,
+        media_type=media_type,
+        headers={"Content-Disposition": _content_disposition(filename), "Accept-Ranges": "bytes", **passthrough},
+        # body() never runs if the client leaves before the first chunk
+        background=BackgroundTask(upstream.aclose),
+    )
+
+
+def _follow_file_fill(fill: _CacheFill, filename: str, media_type: str) -> StreamingResponse:
+    headers = {"Content-Disposition": _content_disposition(filename), "Accept-Ranges": "bytes", **fill.headers}
+    return StreamingResponse(fill.open(DOWNLOAD_CHUNK_SIZE), media_type=media_type, headers=headers)
+
+
+async def _iter_download(url: str):
+    """Yield the body of an upstream file in chunks; raises if it isn't a 200."""
+    async with get_download_http().stream("GET", url) as upstream:
+        if upstream.status_code != 200:
+            raise RuntimeError(f"upstream returned {upstream.status_code}")
+        async for chunk in upstream.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+            yield chunk
+
+
+def _open_polar_file(file_obj: Dict[str, Any]):
+    """Async iterator over a Polar file's bytes: from the file cache when
+    present, otherwise by following the (possibly shared) fill of it."""
+    checksum = _file_checksum(file_obj)
+    if checksum:
+        cached = _file_cache.get(checksum)
+        if cached:
+            return _iter_local_file(cached, DOWNLOAD_CHUNK_SIZE)
+        fill = _file_fills.get(checksum)
+        if fill is None:
+            fill = _CacheFill(_file_cache, checksum, _iter_download(file_obj["download_url"]), _file_fills,
+                              expected_sha256=checksum, expected_size=file_obj.get("size"))
+        return fill.open(DOWNLOAD_CHUNK_SIZE)
+    return _iter_download(file_obj["download_url"])
+
+
+async def _serve_polar_file(file_obj: Dict[str, Any], filename: str, range_header: Optional[str] = None,
+                            if_range: Optional[str] = None):
+    """Serve one Polar file, from the local cache if possible."""
+    media_type = file_obj.get("mime_type") or "application/octet-stream"
+    checksum = _file_checksum(file_obj)
+    # Concurrent misses for the same file share one upstream fetch: later ones
+    # wait here for its headers, then follow the fill
+    pending = _file_pending.get(checksum) if checksum and not range_header else None
+    if pending is not None:
+        await asyncio.shield(pending)
+    if checksum:
+        cached = _file_cache.acquire(checksum)
+        if cached:
+            print(f"   ⚡ Serving from file cache: {checksum[:16]}...")
+            # FileResponse answers Range requests from disk by itself
+            return _PinnedFileResponse(cached, cache=_file_cache, name=checksum,
+                                       filename=filename, media_type=media_type)
+
+        fill = _file_fills.get(checksum)
+        if fill is not None and not range_header:
+            print(f"   ⏳ Following in-progress fetch of {checksum[:16]}...")
+            return _follow_file_fill(fill, filename, media_type)
+
+    # Only a full-body fetch can fill the cache; ranged requests just proxy
+    cache_as = {"checksum": checksum, "size": file_obj.get("size")} if checksum and not range_header else None
+    pending = None
+    if cache_as and checksum not in _file_pending:
+        pending = asyncio.get_running_loop().create_future()
+        _file_pending[checksum] = pending
+    try:
+        return await _proxy_download(file_obj["download_url"], filename, media_type,
+                                     range_header=range_header, if_range=if_range, cache_as=cache_as)
+    finally:
+        if pending is not None:
+            del _file_pending[checksum]
+            pending.set_result(None)
+
+
+# ==================== STREAMING ZIP ====================
+
+# Already-compressed formats are stored as-is: deflating them again costs the
+# Pi's CPU and gains almost nothing.
+ZIP_STORED_EXTENSIONS = {
+    ".pdf", ".zip", ".gz", ".tgz", ".bz2", ".xz", ".7z", ".rar",
+    ".png", ".jpg", ".jpeg", ".gif", ".webp", ".heic",
+    ".mp3", ".m4a", ".aac", ".ogg", ".mp4", ".m4v", ".mov", ".webm",
+    ".epub", ".docx", ".xlsx", ".pptx", ".dmg", ".apk",
+}
+ZIP_FETCH_CONCURRENCY = 3  # files fetched ahead of the one being written
+ZIP_PREFETCH_CHUNKS = 16  # per-file read-ahead, in DOWNLOAD_CHUNK_SIZE chunks
+
+
+class _ZipStreamSink:
+    """Write-only, unseekable file object that collects zipfile output.
+
+    Without seek() zipfile writes each entry's sizes and CRC in a trailing
+    data descriptor, which is what lets the archive be emitted front to back.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._position = 0
+
+    def write(self, data) -> int:
+        self._buffer += data
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+def _unique_arcname(name: str, used: set) -> str:
+    candidate, counter = name, 2
+    while candidate in used:
+        stem, ext = os.path.splitext(name)
+        candidate = f"{stem} ({counter}){ext}"
+        counter += 1
+    used.add(candidate)
+    return candidate
+
+
+async def _stream_zip(entries: List[Dict[str, Any]], concurrency: int = ZIP_FETCH_CONCURRENCY,
+                      skipped: Optional[List[str]] = None):
+    """Yield a ZIP archive of ``entries`` while it is being produced.
+
+    Each entry is {"name", "size" (hint, may be None), "open"}, where open() returns
+    an async iterator of the file's bytes. Up to ``concurrency`` files are
+    fetched ahead into small bounded queues, so memory stays flat however
+    large the bundle is. An entry that fails before its first byte is skipped
+    (as the old temp-dir builder did) and its name appended to ``skipped``;
+    a failure mid-entry aborts the stream.
+    """
+    import zipfile
+
+    queues: List[Optional[asyncio.Queue]] = [None] * len(entries)
+    producers: List[asyncio.Task] = []
+
+    async def produce(entry, queue: asyncio.Queue):
+        try:
+            async for chunk in entry["open"]():
+                await queue.put(chunk)
+            await queue.put(None)
+        except Exception as e:
+            await queue.put(e)
+
+    def start(index: int):
+        if index < len(entries):
+            queues[index] = asyncio.Queue(maxsize=ZIP_PREFETCH_CHUNKS)
+            producers.append(asyncio.create_task(produce(entries[index], queues[index])))
+
+    for index in range(min(concurrency, len(entries))):
+        start(index)
+
+    sink = _ZipStreamSink()
+    used_names: set = set()
+    written = 0
+    try:
+        with zipfile.ZipFile(sink, mode="w", allowZip64=True) as archive:
+            for index, entry in enumerate(entries):
+                queue = queues[index]
+                first = await queue.get()
+                if isinstance(first, Exception):
+                    print(f"   ❌ Skipping {entry['name']}: {first}")
+                    if skipped is not None:
+                        skipped.append(entry["name"])
+                    start(index + concurrency)
+                    continue
+
+                info = zipfile.ZipInfo(_unique_arcname(entry["name"], used_names), time.localtime()[:6])
+                ext = os.path.splitext(entry["name"])[1].lower()
+                info.compress_type = zipfile.ZIP_STORED if ext in ZIP_STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+                # Size hint: lets zipfile pick ZIP64 up front for entries over 4 GiB
+                info.file_size = entry.get("size") or 0
+                info.external_attr = 0o644 << 16
+
+                with archive.open(info, mode="w") as member:
+                    chunk = first
+                    while chunk is not None:
+                        if isinstance(chunk, Exception):
+                            raise chunk
+                        member.write(chunk)
+                        data = sink.drain()
+                        if data:
+                            yield data
+                        chunk = await queue.get()
+                written += 1
+                print(f"   [{index+1}/{len(entries)}] ✅ Zipped {info.filename}")
+                start(index + concurrency)
+        tail = sink.drain()
+        if tail:
+            yield tail
+        print(f"   ✅ ZIP stream complete ({written} file(s), {sink.tell()} bytes)")
+    finally:
+        for task in producers:
+            task.cancel()
+
+
+# ==================== BUNDLE CACHE ====================
+# Finished multi-file ZIPs, keyed by the product and the exact set of file
+# checksums in it, so a hot bundle is built once and then served as a static
+# file until one of its files changes. Budget: BUNDLE_CACHE_MAX_MB.
+
+_bundle_cache = DiskCache(
+    os.path.join(CACHE_ROOT, "bundles"),
+    max_bytes=lambda: get_settings().bundle_cache_max_mb * 1024 * 1024,
+)
+_bundle_builds: Dict[str, _CacheFill] = {}  # bundle key -> its in-progress build
+
+
+def _bundle_key(product_id: str, files: List[Dict[str, Any]]) -> Optional[str]:
+    """Identity of a bundle's contents, or None if any file lacks a checksum."""
+    parts = []
+    for f_obj in files:
+        checksum = _file_checksum(f_obj)
+        if not checksum:
+            return None
+        parts.append(f"{f_obj.get('name')}\0{checksum}")
+    raw = product_id + "\n" + "\n".join(sorted(parts))
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+async def _serve_bundle(product_id: str, found_files: List[Dict[str, Any]], entries: List[Dict[str, Any]]):
+    return await _serve_zip(f"{product_id}_bundle.zip", _bundle_key(product_id, found_files), entries)
+
+
+async def _serve_zip(filename: str, bundle_key: Optional[str], entries: List[Dict[str, Any]]):
+    """Serve a ZIP of ``entries`` through the bundle cache, or stream it
+    uncached when there is no ``bundle_key`` to identify its contents.
+
+    A missing bundle is built once, in the background, into the cache;
+    this and any concurrent request for it stream the build as it grows.
+    """
+    headers = {"Content-Disposition": _content_disposition(filename)}
+    if not bundle_key:
+        return StreamingResponse(_stream_zip(entries), media_type="application/zip", headers=headers)
+
+    cached = _bundle_cache.acquire(bundle_key)
+    if cached:
+        print(f"   ⚡ Serving cached bundle: {bundle_key[:16]}...")
+        return _PinnedFileResponse(cached, cache=_bundle_cache, name=bundle_key,
+                                   filename=filename, media_type="application/zip")
+
+    build = _bundle_builds.get(bundle_key)
+    if build is not None:
+        print("   ⏳ Bundle is being built by another request, following it")
+    else:
+        skipped: List[str] = []
+        # Bundles missing a file are served but not cached
+        build = _CacheFill(_bundle_cache, bundle_key, _stream_zip(entries, skipped=skipped), _bundle_builds,
+                           verify=lambda: not skipped)
+    return StreamingResponse(build.open(DOWNLOAD_CHUNK_SIZE), media_type="application/zip", headers=headers)
+
+
+# ==================== DOWNLOAD RESOLUTION ====================
+# The upstream steps that decide what a customer may download. /api/download
+# runs all of them on every request; signed links (below) run them once.
+#
+# Customer Portal sessions and downloadables listings are cached per
+# customer_id, so a family downloading several products in a row pays for one
+# session and one listing. A session is reused until shortly before its
+# expires_at; a listing for DOWNLOADABLES_CACHE_TTL_SECONDS (default 300), but
+# never past the earliest presigned URL expiry in it.
+
+# Presigned URLs and session tokens this close to expiry are treated as expired.
+DOWNLOAD_URL_MARGIN_SECONDS = 60
+
+_customer_sessions = TTLCache(max_entries=1000)
+_downloadables_cache = TTLCache(max_entries=1000)
+
+class _DownloadError(Exception):
+    """A download step failed; carries the status and message for the client."""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+    def response(self) -> JSONResponse:
+        return JSONResponse(status_code=self.status_code, content={"error": self.message})
+
+
+def _find_customer_id(polar, email: str) -> Optional[str]:
+    # Filtered server-side: one call instead of paging through every customer
+    response = polar.customers.list(email=email, limit=100)
+    for customer in _iter_polar_items(response):
+        if getattr(customer, 'email', None) == email:
+            return str(customer.id)
+    return None
+
+
+# Product ids each customer owns -- from their orders, plus any product all of
+# whose benefits they've been granted (covers manual grants; products share
+# benefits, e.g. a bundle carries its packs' downloadables, so one granted
+# benefit doesn't imply every product that has it) -- cached for
+# ENTITLEMENT_CACHE_TTL_SECONDS (default 600), so the ownership check is a set
+# lookup and downloading five products costs one load. A miss against a set
+# older than ENTITLEMENT_RECHECK_SECONDS reloads it, so a purchase made a
+# minute ago isn't refused; a sync that sees new orders drops the set; and
+# invalidate_entitlements() is there for anything else that changes grants.
+
+ENTITLEMENT_RECHECK_SECONDS = 30
+
+_entitlements = TTLCache(max_entries=5000)  # customer_id -> (frozenset of product ids, loaded_at)
+_product_benefits = TTLCache(max_entries=1)  # "map" -> {product_id: frozenset of benefit ids}
+
+
+def invalidate_entitlements(customer_id: Optional[str] = None):
+    """Forget one customer's entitlements, or everyone's."""
+    if customer_id is None:
+        _entitlements.clear()
+    else:
+        _entitlements.pop(customer_id)
+
+
+def _order_product_id(order) -> Optional[str]:
+    if hasattr(order, 'product') and hasattr(order.product, 'id'):
+        return str(order.product.id)
+    if getattr(order, 'product_id', None):
+        return str(order.product_id)
+    return None
+
+
+def _granted_benefit_ids(polar, customer_id: str) -> set:
+    """Benefits currently granted to the customer, from the customer state."""
+    get_state = getattr(polar.customers, "get_state", None)
+    if get_state is None:
+        return set()
+    try:
+        state = get_state(id=customer_id)
     except Exception as e:
-        print(f"❌ Error validating license: {e}")
-        import traceback
-        traceback.print_exc()
-        return JSONResponse(status_code=500, content={"error": str(e)})
+        print(f"   ⚠️ Could not fetch customer state: {e}")
+        return set()
+    granted = getattr(state, "granted_benefits", None) or []
+    return {str(getattr(g, "benefit_id", "")) for g in granted} - {""}
 
 
-# ==================== SYNC ENDPOINT ====================
+def _list_product_benefits(polar) -> Dict[str, frozenset]:
+    """product_id -> the benefit ids it grants. Blocking."""
+    return {
+        str(prod.id): frozenset(
+            str(getattr(benefit, 'id', '')) for benefit in getattr(prod, 'benefits', None) or []
+        ) - {""}
+        for prod in _iter_polar_items(polar.products.list(limit=100))
+    }
 
-class SyncRequest(BaseModel):
-    email: str
 
-@app.post("/api/sync-purchases")
-async def sync_purchases(request: SyncRequest):
-    polar = get_polar_client()
+async def _product_benefits_map(polar) -> Dict[str, frozenset]:
+    """product_id -> benefit ids, cached like the catalog."""
+    mapping = _product_benefits.get("map")
+    if mapping is not None:
+        return mapping
 
-    if not polar:
-        return {"success": False, "error": "API misconfigured"}
+    async def load():
+        mapping = await asyncio.to_thread(_list_product_benefits, polar)
+        _product_benefits.set("map", mapping, get_settings().catalog_max_age_seconds)
+        return mapping
+
+    return await _upstream_flights.do(("polar", "product-benefits"), load, timeout=30)
 
+
+async def _load_entitlements(polar, customer_id: str) -> frozenset:
+    async def load():
+        orders, granted = await asyncio.gather(
+            asyncio.to_thread(_customer_orders, polar, customer_id),
+            asyncio.to_thread(_granted_benefit_ids, polar, customer_id),
+        )
+        owned = {pid for pid in map(_order_product_id, orders) if pid}
+        if granted:
+            mapping = await _product_benefits_map(polar)
+            owned.update(pid for pid, benefit_ids in mapping.items() if benefit_ids and benefit_ids <= granted)
+        owned = frozenset(owned)
+        _entitlements.set(customer_id, (owned, time.monotonic()), get_settings().entitlement_cache_ttl_seconds)
+        print(f"   📋 Loaded entitlements for {customer_id}: {len(owned)} product(s)")
+        return owned
+
+    return await _upstream_flights.do(("polar-entitlements", customer_id), load, timeout=30)
+
+
+async def _customer_owns_product(polar, customer_id: str, product_id: str) -> bool:
+    entry = _entitlements.get(customer_id)
+    if entry is not None:
+        owned, loaded_at = entry
+        if product_id in owned or time.monotonic() - loaded_at < ENTITLEMENT_RECHECK_SECONDS:
+            return product_id in owned
+    return product_id in await _load_entitlements(polar, customer_id)
+
+
+async def _product_benefit_ids(polar, product_id: str) -> set:
+    """Benefit ids granted by a product, used to pick its downloadables."""
     try:
-        results = []
+        mapping = await _product_benefits_map(polar)
+    except Exception as e:
+        print(f"   ⚠️ Could not fetch product benefits: {e}")
+        return set()
+    benefit_ids = set(mapping.get(product_id, ()))
+    print(f"   📋 Product benefit IDs: {benefit_ids}")
+    return benefit_ids
 
-        # First, find customer by email
-        customers_response = polar.customers.list()
-        customer_id = None
 
-        if customers_response and customers_response.result:
-            for customer in customers_response.result.items:
-                if hasattr(customer, 'email') and customer.email == request.email:
-                    customer_id = customer.id
-                    print(f"✅ Found customer: {customer_id} for email: {request.email}")
-                    break
+def _seconds_until(value: Optional[str]) -> Optional[float]:
+    """Seconds from now until an ISO timestamp, less the safety margin."""
+    expires = _parse_iso_datetime(value)
+    if expires is None:
+        return None
+    return expires.timestamp() - time.time() - DOWNLOAD_URL_MARGIN_SECONDS
 
-        if not customer_id:
-            print(f"ℹ️ No customer found with email: {request.email}")
-            return {"success": True, "purchases": [], "count": 0}
 
-        # Fetch ALL license keys for this customer
-        # First, we need to build a benefit_id -> product_id map from products
-        # This allows us to associate license keys (which have benefit_id) with products
-        
-        benefit_to_product = {}  # benefit_id -> product_id
-        try:
-            products_response = polar.products.list()
-            if products_response and products_response.result:
-                for prod in products_response.result.items:
-                    prod_id = str(prod.id)
-                    if hasattr(prod, 'benefits') and prod.benefits:
-                        for benefit in prod.benefits:
-                            benefit_id = str(getattr(benefit, 'id', ''))
-                            benefit_type = getattr(benefit, 'TYPE', None) or getattr(benefit, 'type', None)
-                            if benefit_id:
-                                benefit_to_product[benefit_id] = {
-                                    'product_id': prod_id,
-                                    'product_name': prod.name,
-                                    'benefit_type': benefit_type
-                                }
-            print(f"\n   📋 Built benefit->product map: {len(benefit_to_product)} benefits")
-            for bid, info in benefit_to_product.items():
-                print(f"      - {bid[:8]}... -> {info['product_name']} ({info['benefit_type']})")
-        except Exception as e:
-            print(f"⚠️ Could not build benefit->product map: {e}")
-        
-        # Now fetch license keys and map them to products
-        license_keys_by_product = {}  # product_id -> license_key
-        
+async def _create_customer_session(customer_id: str) -> Dict[str, Any]:
+    """Create a Customer Portal session; returns Polar's session object.
+
+    Uses httpx since the SDK's customer_sessions.create() has different params.
+    """
+    api_config = get_polar_api_config()
+    session_url = f"{api_config['base_url']}/v1/customer-sessions/"
+    headers = {
+        "Authorization": f"Bearer {api_config['token']}",
+        "Content-Type": "application/json",
+        "Accept": "application/json"
+    }
+    print(f"\n🔐 Creating customer session...")
+    print(f"   POST {session_url}")
+    try:
+        resp = await get_polar_http().post(session_url, json={"customer_id": customer_id}, headers=headers)
+    except Exception as e:
+        print(f"   ❌ Failed to create customer session: {e}")
+        raise _DownloadError(500, f"Failed to create customer session: {str(e)}")
+    print(f"   Response Status: {resp.status_code}")
+
+    if resp.status_code not in (200, 201):
+        print(f"   ❌ Session creation failed: {resp.text[:500]}")
+        raise _DownloadError(500, f"Failed to create customer session: {resp.text}")
+    session = resp.json()
+    session_token = session.get("token")
+    print(f"   ✅ Customer session created: {session_token[:20] if session_token else 'N/A'}...")
+    return session
+
+
+async def _customer_session_token(customer_id: str) -> str:
+    """A Customer Portal token for the customer, reused while it is valid."""
+    token = _customer_sessions.get(customer_id)
+    if token:
+        return token
+
+    async def create():
+        session = await _create_customer_session(customer_id)
+        token = session.get("token")
+        ttl = _seconds_until(session.get("expires_at"))
+        if token and ttl and ttl > 0:
+            _customer_sessions.set(customer_id, token, ttl)
+        return token
+
+    return await _upstream_flights.do(("polar-customer-session", customer_id), create, timeout=30)
+
+
+async def _list_downloadables(session_token: str) -> List[Dict[str, Any]]:
+    """Every downloadable of the session's customer, from the Customer Portal API."""
+    api_config = get_polar_api_config()
+    downloadables_url = f"{api_config['base_url']}/v1/customer-portal/downloadables"
+    portal_headers = {
+        "Authorization": f"Bearer {session_token}",
+        "Accept": "application/json"
+    }
+    print(f"\n🔍 Fetching downloadables: {downloadables_url}")
+    resp = await get_polar_http().get(downloadables_url, headers=portal_headers, follow_redirects=True)
+    print(f"   Response Status: {resp.status_code}")
+
+    if resp.status_code != 200:
+        print(f"   ❌ Error response: {resp.text[:500]}")
+        raise _DownloadError(resp.status_code, f"Failed to fetch downloadables: {resp.text}")
+    items = resp.json().get("items", [])
+    print(f"   📦 Total downloadables found: {len(items)}")
+    return items
+
+
+def _downloadables_ttl(items: List[Dict[str, Any]]) -> float:
+    ttl = get_settings().downloadables_cache_ttl_seconds
+    for item in items:
+        remaining = _seconds_until(item.get("file", {}).get("download", {}).get("expires_at"))
+        if remaining is not None:
+            ttl = min(ttl, remaining)
+    return max(ttl, 0)
+
+
+async def _customer_downloadables(customer_id: str) -> List[Dict[str, Any]]:
+    """The customer's downloadables listing, cached while its URLs are good."""
+    items = _downloadables_cache.get(customer_id)
+    if items is not None:
+        print(f"   ⚡ Using cached downloadables for customer {customer_id}")
+        return items
+
+    async def fetch():
         try:
-            org_id = os.getenv("POLAR_ORGANIZATION_ID")
-            if org_id:
-                license_keys_response = polar.license_keys.list(
-                    organization_id=org_id
-                )
-                if license_keys_response and license_keys_response.result:
-                    for lk in license_keys_response.result.items:
-                        # Check if this license belongs to our customer
-                        lk_customer_id = getattr(lk, 'customer_id', None)
-                        if lk_customer_id == customer_id:
-                            key_value = getattr(lk, 'key', None)
-                            benefit_id = str(getattr(lk, 'benefit_id', ''))
-                            
-                            print(f"\n   🔑 Found license key: {key_value[:12] if key_value else 'N/A'}...")
-                            print(f"      - benefit_id: {benefit_id}")
-                            
-                            # Use the benefit_to_product map to find which product this license belongs to
-                            if benefit_id in benefit_to_product and key_value:
-                                prod_info = benefit_to_product[benefit_id]
-                                prod_id = prod_info['product_id']
-                                license_keys_by_product[prod_id] = key_value
-                                print(f"      - ✅ Mapped to product: {prod_info['product_name']} (id: {prod_id})")
-                            else:
-                                print(f"      - ⚠️ No product mapping found for this benefit")
-                                
-                    print(f"\n   📊 License keys by product: {len(license_keys_by_product)}")
-                    for pid, key in license_keys_by_product.items():
-                        print(f"      - {pid} -> {key[:12]}...")
-        except Exception as e:
-            print(f"⚠️ Could not fetch license keys: {e}")
-            import traceback
-            traceback.print_exc()
-
-        # Fetch orders for this customer
-        orders_response = polar.orders.list()
-
-        if orders_response and orders_response.result:
-            for order in orders_response.result.items:
-                # Check if this order belongs to the customer
-                if hasattr(order, 'customer_id') and order.customer_id == customer_id:
-                    product = order.product if hasattr(order, 'product') else None
-                    product_id = str(product.id) if product and hasattr(product, 'id') else str(getattr(order, 'product_id', ''))
-                    product_name = product.name if product and hasattr(product, 'name') else "Unknown"
-
-                    # Note: order.product typically doesn't include full benefits info
-                    # hasFiles and isLicenseProduct should come from /api/products, not sync
-                    # We only try to match license keys here
-                    has_files = None  # None = use value from products API
-                    is_license_product = None  # None = use value from products API
-                    product_benefit_ids = []
-                    
-                    print(f"\n   🔍 Processing order for: {product_name} (id: {product_id})")
-                    
-                    # Try to get benefits if available on order.product
-                    if product and hasattr(product, 'benefits') and product.benefits:
-                        print(f"      - Benefits found on order.product: {len(product.benefits)}")
-                        for benefit in product.benefits:
-                            benefit_type = getattr(benefit, 'TYPE', None) or getattr(benefit, 'type', None)
-                            benefit_id = str(getattr(benefit, 'id', ''))
-                            print(f"      - Benefit: TYPE={benefit_type}, id={benefit_id[:8]}...")
-                            
-                            if benefit_type == 'downloadables':
-                                has_files = True
-                            elif benefit_type == 'license_keys':
-                                is_license_product = True
-                                product_benefit_ids.append(benefit_id)
-                    else:
-                        print(f"      - No benefits on order.product (will use values from products API)")
-
-                    # Try to find a license key for this product (via product_id lookup)
-                    license_key = None
-                    
-                    if product_id in license_keys_by_product:
-                        license_key = license_keys_by_product[product_id]
-                        is_license_product = True  # Override since we found a key
-                        print(f"      - ✅ Found license key for this product!")
-                    else:
-                        print(f"      - ℹ️ No license key for this product")
-
-                    results.append({
-                        "productId": product_id,
-                        "variantId": None,
-                        "productName": product_name,
-                        "orderId": str(order.id),
-                        "hasFiles": has_files,  # None = frontend should use products API value
-                        "isLicenseProduct": is_license_product,  # None = frontend should use products API value
-                        "licenseKey": license_key,
-                    })
-
-        print(f"📦 Found {len(results)} purchases for {request.email}")
-        for r in results:
-            files_info = "📁 Has files" if r.get('hasFiles') else "📄 No files"
-            key_info = f"🔑 {r.get('licenseKey', '')[:8]}..." if r.get('licenseKey') else "🔓 No key"
-            print(f"   - {r['productName']}: {files_info} | {key_info}")
+            items = await _list_downloadables(await _customer_session_token(customer_id))
+        except _DownloadError as e:
+            if e.status_code != 401:
+                raise
+            # The cached session was revoked or expired early: start a new one
+            _customer_sessions.pop(customer_id)
+            items = await _list_downloadables(await _customer_session_token(customer_id))
+        ttl = _downloadables_ttl(items)
+        if ttl > 0:
+            _downloadables_cache.set(customer_id, items, ttl)
+        return items
+
+    return await _upstream_flights.do(("polar-downloadables", customer_id), fetch, timeout=60)
+
+
+def _files_for_product(items: List[Dict[str, Any]], benefit_ids: set) -> List[Dict[str, Any]]:
+    """Flatten the downloadables granted by the product's benefits into file
+    dicts. Without benefit ids every downloadable is included."""
+    found_files = []
+    for item in items:
+        if benefit_ids and item.get("benefit_id", "") not in benefit_ids:
+            continue
+        file_info = item.get("file", {})
+        download_info = file_info.get("download", {})
+        found_files.append({
+            "id": file_info.get("id"),
+            "name": file_info.get("name"),
+            "size": file_info.get("size"),
+            "mime_type": file_info.get("mime_type"),
+            "checksum_sha256": file_info.get("checksum_sha256_hex") or file_info.get("checksum_sha256"),
+            "download_url": download_info.get("url"),
+            "expires_at": download_info.get("expires_at")
+        })
+    return found_files
+
+
+async def _fetch_product_files(polar, customer_id: str, product_id: str) -> List[Dict[str, Any]]:
+    """Steps 3-4: the product's files with fresh presigned URLs, for a
+    customer already known to own it."""
+    items, benefit_ids = await asyncio.gather(
+        _customer_downloadables(customer_id),
+        _product_benefit_ids(polar, product_id),
+    )
+    found_files = _files_for_product(items, benefit_ids)
+    print(f"   ✅ Files for this product: {len(found_files)}")
+    if not found_files:
+        print("\n" + "=" * 70)
+        print("❌ NO FILES FOUND FOR THIS PRODUCT")
+        print("=" * 70)
+        raise _DownloadError(404, "No files found for this product")
+    return found_files
+
+
+async def _authorize_download(polar, email: str, product_id: str):
+    """Run every authorization step; returns (customer_id, found_files)."""
+    # Step 1: Find customer by email
+    customer_id = await asyncio.to_thread(_find_customer_id, polar, email)
+    if not customer_id:
+        print(f"⚠️ No customer found with email: {email}")
+        raise _DownloadError(404, "Customer not found")
+    print(f"   ✅ Found customer: {customer_id}")
+
+    # Step 2: Verify customer has purchased this product
+    if not await _customer_owns_product(polar, customer_id, product_id):
+        print(f"❌ No orders found for product {product_id} and customer {email}")
+        raise _DownloadError(404, "No purchase found for this product")
+
+    # Steps 3-4: Customer session, then the product's downloadables
+    return customer_id, await _fetch_product_files(polar, customer_id, product_id)
+
+
+async def _serve_product_files(request: Request, product_id: str, found_files: List[Dict[str, Any]]):
+    """Stream a single file as-is, or several as one ZIP."""
+    print("\n" + "=" * 70)
+    print(f"✅ FOUND {len(found_files)} FILE(S)")
+    print("=" * 70)
+    for i, f_obj in enumerate(found_files):
+        print(f"[{i+1}] 📄 {f_obj.get('name')} ({f_obj.get('size')} bytes)")
 
-        return {"success": True, "purchases": results, "count": len(results)}
+    print("\n" + "-" * 70)
 
-    except Exception as e:
-        print(f"❌ Error syncing purchases: {e}")
-        import traceback
-        traceback.print_exc()
-        return {"success": False, "error": str(e)}
+    if len(found_files) == 1:
+        # Single File -> Proxy Stream
+        file_obj = found_files[0]
+        d_url = file_obj.get("download_url")
+        fname = file_obj.get("name", f"{product_id}.zip")
 
+        print(f"📦 SINGLE FILE MODE: Streaming '{fname}'")
 
-# ==================== DOWNLOAD ENDPOINT ====================
+        if not d_url:
+            print("❌ ERROR: download_url is empty/null!")
+            return JSONResponse(status_code=500, content={"error": "File has no download URL"})
 
-def log_file_details(file_obj, prefix=""):
-    """Helper to log detailed file object info for Polar downloads"""
-    print(f"{prefix}📄 FILE OBJECT DETAILS:")
-    print(f"{prefix}   ├─ id: {getattr(file_obj, 'id', 'unknown')}")
-    print(f"{prefix}   ├─ name: {getattr(file_obj, 'name', 'unknown')}")
-    print(f"{prefix}   ├─ size: {getattr(file_obj, 'size', 'unknown')} bytes")
-    print(f"{prefix}   ├─ checksum_sha256: {getattr(file_obj, 'checksum_sha256', 'N/A')}")
-    download_url = getattr(file_obj, 'download_url', None)
-    if download_url and len(download_url) > 80:
-        download_url = download_url[:80] + "..."
-    print(f"{prefix}   └─ download_url: {download_url}")
+        print(f"   Initiating stream from Polar download URL...")
+        print(f"   URL: {d_url[:100]}...")
+
+        try:
+            return await _serve_polar_file(file_obj, fname, range_header=request.headers.get("range"),
+                                           if_range=request.headers.get("if-range"))
+        except Exception as e:
+            print(f"   ❌ Download error: {e}")
+            return JSONResponse(status_code=500, content={"error": f"Download failed: {str(e)}"})
+
+    # Multi File -> Zip streamed while the files are fetched
+    print(f"📦 MULTI FILE MODE: Streaming {len(found_files)} files as a ZIP")
+
+    entries = []
+    for idx, f_obj in enumerate(found_files):
+        if not f_obj.get("download_url"):
+            print(f"   ⚠️ Skipping {f_obj.get('name')} - no download_url")
+            continue
+        entries.append({
+            "name": f_obj.get("name") or f"file_{idx}",
+            "size": f_obj.get("size"),
+            "open": lambda f_obj=f_obj: _open_polar_file(f_obj),
+        })
+
+    return await _serve_bundle(product_id, found_files, entries)
 
 
 @app.get("/api/download")
-async def download_product(product_id: str = "", email: str = ""):
+async def download_product(request: Request, product_id: str = "", email: str = ""):
     print("=" * 70)
     print(f"📥 DOWNLOAD REQUEST RECEIVED")
     print(f"   Product ID: {product_id}")
@@ -818,277 +2745,172 @@ async def download_product(product_id: str = "", email: str = ""):
         return JSONResponse(status_code=500, content={"error": "Server misconfigured (missing API key)"})
 
     try:
-        # Step 1: Find customer by email
-        customer_id = None
-        customers_response = polar.customers.list()
-
-        if customers_response and customers_response.result:
-            for customer in customers_response.result.items:
-                if hasattr(customer, 'email') and customer.email == email:
-                    customer_id = customer.id
-                    print(f"   ✅ Found customer: {customer_id}")
-                    break
-
-        if not customer_id:
-            print(f"⚠️ No customer found with email: {email}")
-            return JSONResponse(status_code=404, content={"error": "Customer not found"})
-
-        # Step 2: Verify customer has purchased this product
-        orders_response = polar.orders.list()
-        has_order = False
-        
-        if orders_response and orders_response.result:
-            for order in orders_response.result.items:
-                if hasattr(order, 'customer_id') and order.customer_id == customer_id:
-                    order_product_id = None
-                    if hasattr(order, 'product') and hasattr(order.product, 'id'):
-                        order_product_id = str(order.product.id)
-                    elif hasattr(order, 'product_id'):
-                        order_product_id = str(order.product_id)
-                    
-                    if order_product_id == product_id:
-                        has_order = True
-                        print(f"   ✅ Found matching order: {order.id}")
-                        break
-
-        if not has_order:
-            print(f"❌ No orders found for product {product_id} and customer {email}")
-            return JSONResponse(status_code=404, content={"error": "No purchase found for this product"})
-
-        # Step 3: Create a customer session to access Customer Portal API
-        # Using httpx since the SDK's customer_sessions.create() has different params
-        print(f"\n🔐 Creating customer session...")
-        api_config = get_polar_api_config()
-        session_token = None
-        
-        try:
-            async with httpx.AsyncClient(timeout=30.0) as session_client:
-                session_url = f"{api_config['base_url']}/v1/customer-sessions/"
-                headers = {
-                    "Authorization": f"Bearer {api_config['token']}",
-                    "Content-Type": "application/json",
-                    "Accept": "application/json"
-                }
-                body = {"customer_id": str(customer_id)}
-                
-                print(f"   POST {session_url}")
-                print(f"   Body: {body}")
-                
-                resp = await session_client.post(session_url, json=body, headers=headers)
-                print(f"   Response Status: {resp.status_code}")
-                
-                if resp.status_code == 201 or resp.status_code == 200:
-                    resp_data = resp.json()
-                    session_token = resp_data.get("token")
-                    print(f"   ✅ Customer session created: {session_token[:20] if session_token else 'N/A'}...")
-                else:
-                    print(f"   ❌ Session creation failed: {resp.text[:500]}")
-                    return JSONResponse(status_code=500, content={"error": f"Failed to create customer session: {resp.text}"})
-            
-        except Exception as e:
-            print(f"   ❌ Failed to create customer session: {e}")
-            import traceback
-            traceback.print_exc()
-            return JSONResponse(status_code=500, content={"error": f"Failed to create customer session: {str(e)}"})
+        _, found_files = await _authorize_download(polar, email, product_id)
+        return await _serve_product_files(request, product_id, found_files)
+    except _DownloadError as e:
+        return e.response()
+    except Exception as e:
+        print(f"\n❌ OUTER DOWNLOAD ERROR: {e}")
+        import traceback
+        traceback.print_exc()
+        return JSONResponse(status_code=500, content={"error": str(e)})
 
-        # Step 4: Use the session token to fetch downloadables from Customer Portal API
-        api_config = get_polar_api_config()
-        
-        async with httpx.AsyncClient(timeout=60.0, follow_redirects=True) as client:
-            # Customer Portal API uses the session token for auth
-            portal_headers = {
-                "Authorization": f"Bearer {session_token}",
-                "Accept": "application/json"
-            }
-            
-            # Fetch downloadables for this customer
-            downloadables_url = f"{api_config['base_url']}/v1/customer-portal/downloadables"
-            print(f"\n🔍 Fetching downloadables: {downloadables_url}")
-            
-            resp = await client.get(downloadables_url, headers=portal_headers)
-            print(f"   Response Status: {resp.status_code}")
-            
-            if resp.status_code != 200:
-                print(f"   ❌ Error response: {resp.text[:500]}")
-                return JSONResponse(status_code=resp.status_code, content={"error": f"Failed to fetch downloadables: {resp.text}"})
-            
-            resp_data = resp.json()
-            items = resp_data.get("items", [])
-            print(f"   📦 Total downloadables found: {len(items)}")
-            
-            # Filter to only files for the requested product
-            # We need to match by benefit_id - find benefit_ids for this product first
-            found_files = []
-            
-            # Get product benefits to know which benefit_ids belong to this product
-            product_benefit_ids = set()
-            try:
-                products_response = polar.products.list()
-                if products_response and products_response.result:
-                    for prod in products_response.result.items:
-                        if str(prod.id) == product_id:
-                            if hasattr(prod, 'benefits') and prod.benefits:
-                                for benefit in prod.benefits:
-                                    bid = str(getattr(benefit, 'id', ''))
-                                    if bid:
-                                        product_benefit_ids.add(bid)
-                            break
-                print(f"   📋 Product benefit IDs: {product_benefit_ids}")
-            except Exception as e:
-                print(f"   ⚠️ Could not fetch product benefits: {e}")
-            
-            # Filter downloadables to only those matching our product
-            for item in items:
-                item_benefit_id = item.get("benefit_id", "")
-                file_info = item.get("file", {})
-                
-                # If we have product_benefit_ids, filter; otherwise include all
-                if product_benefit_ids and item_benefit_id not in product_benefit_ids:
-                    continue
-                
-                download_info = file_info.get("download", {})
-                found_files.append({
-                    "id": file_info.get("id"),
-                    "name": file_info.get("name"),
-                    "size": file_info.get("size"),
-                    "mime_type": file_info.get("mime_type"),
-                    "download_url": download_info.get("url"),
-                    "expires_at": download_info.get("expires_at")
-                })
-            
-            print(f"   ✅ Files for this product: {len(found_files)}")
-            
-            if not found_files:
-                print("\n" + "=" * 70)
-                print("❌ NO FILES FOUND FOR THIS PRODUCT")
-                print("=" * 70)
-                return JSONResponse(status_code=404, content={"error": "No files found for this product"})
-
-            # ==================== LOG ALL FILE DETAILS ====================
-            print("\n" + "=" * 70)
-            print(f"✅ FOUND {len(found_files)} FILE(S)")
-            print("=" * 70)
-            for i, f_obj in enumerate(found_files):
-                print(f"[{i+1}] 📄 {f_obj.get('name')} ({f_obj.get('size')} bytes)")
-
-            # ==================== SINGLE VS MULTI FILE HANDLING ====================
-            print("\n" + "-" * 70)
-
-            if len(found_files) == 1:
-                # Single File -> Proxy Stream
-                file_obj = found_files[0]
-                d_url = file_obj.get("download_url")
-                fname = file_obj.get("name", f"{product_id}.zip")
-
-                print(f"📦 SINGLE FILE MODE: Streaming '{fname}'")
-
-                if not d_url:
-                    print("❌ ERROR: download_url is empty/null!")
-                    return JSONResponse(status_code=500, content={"error": "File has no download URL"})
-
-                print(f"   Initiating stream from Polar download URL...")
-                print(f"   URL: {d_url[:100]}...")
-
-                # Download to temp file first since we can't stream across contexts
-                import tempfile
-                tmp_file = tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(fname)[1])
-                tmp_path = tmp_file.name
-                
-                try:
-                    r = await client.get(d_url)
-                    print(f"   Upstream Response Status: {r.status_code}")
-                    print(f"   Content-Type: {r.headers.get('content-type')}")
-                    
-                    if r.status_code != 200:
-                        print(f"   ❌ DOWNLOAD FAILED! Response: {r.text[:500]}")
-                        return JSONResponse(
-                            status_code=r.status_code,
-                            content={"error": f"Upstream download failed: {r.status_code}"}
-                        )
-                    
-                    tmp_file.write(r.content)
-                    tmp_file.close()
-                    
-                    file_size = os.path.getsize(tmp_path)
-                    print(f"   ✅ Downloaded {file_size} bytes to temp file")
-                    
-                except Exception as e:
-                    print(f"   ❌ Download error: {e}")
-                    tmp_file.close()
-                    if os.path.exists(tmp_path):
-                        os.remove(tmp_path)
-                    return JSONResponse(status_code=500, content={"error": f"Download failed: {str(e)}"})
-
-                def cleanup_file():
-                    if os.path.exists(tmp_path):
-                        os.remove(tmp_path)
-                        print(f"🗑️ Cleaned up temp file: {tmp_path}")
-
-                return FileResponse(
-                    tmp_path,
-                    filename=fname,
-                    media_type=file_obj.get("mime_type", "application/octet-stream"),
-                    background=BackgroundTask(cleanup_file)
-                )
-            else:
-                # Multi File -> Download & Zip
-                import shutil
-                import zipfile
 
-                print(f"📦 MULTI FILE MODE: Bundling {len(found_files)} files into ZIP")
+# ==================== SIGNED DOWNLOAD LINKS ====================
+# Env vars used:
+#   DOWNLOAD_LINK_SECRET       HMAC key for links (default: derived from the
+#                              Polar token, so changing that token also
+#                              invalidates links already handed out)
+#   DOWNLOAD_LINK_TTL_SECONDS  how long a link stays valid (default 15 minutes)
+#
+# /api/download/authorize does the full customer/order/downloadables check once
+# and returns links of the form /api/download/link/<payload>.<signature>, each
+# bound to (customer, product, file). The link endpoint only verifies the HMAC
+# and expiry, so retries and resumed downloads start streaming without any
+# Polar calls. The authorized file list is kept for the link's lifetime; once
+# Polar's presigned URLs in it run out, they are fetched again for the
+# customer without repeating the order scan.
+
+import hmac
+
+# (customer_id, product_id) -> the authorized files, for as long as links last
+_download_grants = TTLCache(max_entries=2000)
+
+
+def _download_link_secret() -> bytes:
+    """The configured link secret, or one derived from the Polar token: the
+    same in every worker and across restarts, unlike a random one."""
+    settings = get_settings()
+    if settings.download_link_secret:
+        return settings.download_link_secret.encode()
+    if not settings.polar_token:
+        raise RuntimeError("No DOWNLOAD_LINK_SECRET or Polar token to sign download links with")
+    return hmac.new(settings.polar_token.encode(), b"download-links", hashlib.sha256).digest()
+
+
+@app.on_event("startup")
+async def _check_download_link_secret():
+    settings = get_settings()
+    if not settings.download_link_secret:
+        if settings.polar_token:
+            print("⚠️ DOWNLOAD_LINK_SECRET is not set; signing download links with a key derived from the Polar token")
+        else:
+            print("⚠️ DOWNLOAD_LINK_SECRET is not set and there is no Polar token: signed download links are disabled")
+
+
+def _sign_download_link(customer_id: str, product_id: str, file_id: Optional[str], expires: int) -> str:
+    claims = {"c": customer_id, "p": product_id, "f": file_id, "exp": expires}
+    payload = _b64url_encode(json.dumps(claims, separators=(",", ":")).encode())
+    signature = hmac.new(_download_link_secret(), payload.encode(), hashlib.sha256).digest()
+    return f"{payload}.{_b64url_encode(signature)}"
+
+
+def _verify_download_link(token: str):
+    """Return the link's claims if the signature matches, else None.
+    Expiry is left to the caller so it can report it distinctly."""
+    try:
+        payload, signature = token.split(".")
+        expected = hmac.new(_download_link_secret(), payload.encode(), hashlib.sha256).digest()
+        if not hmac.compare_digest(expected, _b64url_decode(signature)):
+            return None
+        return json.loads(_b64url_decode(payload))
+    except Exception:
+        return None
+
+
+def _needs_fresh_urls(product_id: str, files: List[Dict[str, Any]], file_id: Optional[str]) -> bool:
+    """Whether serving the link's file (or, without a file id, the whole
+    product as a bundle) would hit a missing or expiring presigned URL.
+    Files (or bundles) already in the local cache never need one."""
+    if file_id is None:
+        bundle_key = _bundle_key(product_id, files)
+        if bundle_key and _bundle_cache.get(bundle_key):
+            return False
+    else:
+        files = [f for f in files if f.get("id") == file_id]
+        if not files:
+            return True
+    deadline = time.time() + DOWNLOAD_URL_MARGIN_SECONDS
+    for f_obj in files:
+        checksum = _file_checksum(f_obj)
+        if checksum and _file_cache.get(checksum):
+            continue
+        expires = _parse_iso_datetime(f_obj.get("expires_at"))
+        if not f_obj.get("download_url") or (expires is not None and expires.timestamp() < deadline):
+            return True
+    return False
+
+
+@app.get("/api/download/authorize")
+async def authorize_download(product_id: str = "", email: str = "", settings: Settings = Depends(get_settings)):
+    """Check a purchase once and return signed links for its files."""
+    polar = get_polar_client()
+    if not polar:
+        return JSONResponse(status_code=500, content={"error": "Server misconfigured (missing API key)"})
 
-                tmp_dir = tempfile.mkdtemp()
-                zip_path = os.path.join(tempfile.gettempdir(), f"{product_id}_bundle.zip")
+    try:
+        _download_link_secret()
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        return JSONResponse(status_code=503, content={"error": "Signed download links not configured"})
 
-                try:
-                    for idx, f_obj in enumerate(found_files):
-                        d_url = f_obj.get("download_url")
-                        fname = f_obj.get("name", f"file_{idx}")
-                        local_path = os.path.join(tmp_dir, fname)
-
-                        print(f"   [{idx+1}/{len(found_files)}] Downloading: {fname}")
-
-                        if not d_url:
-                            print(f"      ⚠️ Skipping - no download_url")
-                            continue
-
-                        r_sub = await client.get(d_url)
-                        print(f"      Upstream Status: {r_sub.status_code}")
-                        if r_sub.status_code == 200:
-                            with open(local_path, "wb") as f_out:
-                                f_out.write(r_sub.content)
-                            file_size = os.path.getsize(local_path)
-                            print(f"      ✅ Saved ({file_size} bytes)")
-                        else:
-                            print(f"      ❌ Failed to download: {r_sub.text[:200]}")
-
-                    print(f"\n   Creating ZIP archive: {zip_path}")
-                    shutil.make_archive(zip_path.replace('.zip', ''), 'zip', tmp_dir)
-
-                    final_zip_path = zip_path
-                    zip_size = os.path.getsize(final_zip_path)
-                    print(f"   ✅ ZIP created ({zip_size} bytes)")
-
-                finally:
-                    shutil.rmtree(tmp_dir)
-                    print(f"   Cleaned up temp directory: {tmp_dir}")
-
-                def cleanup_zip():
-                    if os.path.exists(final_zip_path):
-                        os.remove(final_zip_path)
-                        print(f"🗑️ Deleted temp zip: {final_zip_path}")
-
-                return FileResponse(
-                    final_zip_path,
-                    filename=f"{product_id}_bundle.zip",
-                    media_type="application/zip",
-                    background=BackgroundTask(cleanup_zip)
-                )
+    print(f"🔏 Authorizing download: product={product_id} email={email}")
+    try:
+        customer_id, found_files = await _authorize_download(polar, email, product_id)
+    except _DownloadError as e:
+        return e.response()
+    except Exception as e:
+        print(f"❌ Download authorization error: {e}")
+        return JSONResponse(status_code=500, content={"error": str(e)})
 
+    ttl = settings.download_link_ttl_seconds
+    expires = int(time.time()) + ttl
+    _download_grants.set((customer_id, product_id), found_files, ttl)
+
+    files = [{
+        "id": f_obj.get("id"),
+        "name": f_obj.get("name"),
+        "size": f_obj.get("size"),
+        "url": f"/api/download/link/{_sign_download_link(customer_id, product_id, f_obj.get('id'), expires)}",
+    } for f_obj in found_files]
+    result = {"success": True, "productId": product_id, "expiresAt": expires, "files": files}
+    if len(found_files) > 1:
+        result["bundleUrl"] = f"/api/download/link/{_sign_download_link(customer_id, product_id, None, expires)}"
+    return result
+
+
+@app.get("/api/download/link/{token}")
+async def download_signed_link(token: str, request: Request):
+    """Serve a link from /api/download/authorize: one file, or the whole
+    product as a ZIP when the link carries no file id."""
+    claims = _verify_download_link(token)
+    if not claims:
+        return JSONResponse(status_code=403, content={"error": "Invalid download link"})
+    if time.time() >= claims.get("exp", 0):
+        return JSONResponse(status_code=403, content={"error": "Download link expired"})
+
+    customer_id, product_id, file_id = claims["c"], claims["p"], claims.get("f")
+    grant_key = (customer_id, product_id)
+    found_files = _download_grants.get(grant_key)
+    try:
+        if found_files is None or _needs_fresh_urls(product_id, found_files, file_id):
+            polar = get_polar_client()
+            if not polar:
+                return JSONResponse(status_code=500, content={"error": "Server misconfigured (missing API key)"})
+            print(f"🔄 Refreshing presigned URLs for signed link: product={product_id}")
+            found_files = await _fetch_product_files(polar, customer_id, product_id)
+            _download_grants.set(grant_key, found_files, max(claims["exp"] - time.time(), 1))
+
+        if file_id is None:
+            return await _serve_product_files(request, product_id, found_files)
+        file_obj = next((f for f in found_files if f.get("id") == file_id), None)
+        if file_obj is None:
+            return JSONResponse(status_code=404, content={"error": "File no longer available"})
+        return await _serve_product_files(request, product_id, [file_obj])
+    except _DownloadError as e:
+        return e.response()
     except Exception as e:
-        print(f"\n❌ OUTER DOWNLOAD ERROR: {e}")
-        import traceback
-        traceback.print_exc()
+        print(f"❌ Signed download error: {e}")
         return JSONResponse(status_code=500, content={"error": str(e)})
 
 
@@ -1150,17 +2972,17 @@ class FeedbackRequest(BaseModel):
     platform: Optional[str] = None
 
 @app.post("/api/send-feedback")
-async def send_feedback(request: FeedbackRequest):
+async def send_feedback(request: FeedbackRequest, settings: Settings = Depends(get_settings)):
     """Send feedback email from the desktop app."""
     import smtplib
     from email.mime.text import MIMEText
     from email.mime.multipart import MIMEMultipart
     
-    smtp_host = os.getenv("SMTP_HOST", "smtp.gmail.com")
-    smtp_port = int(os.getenv("SMTP_PORT", "587"))
-    smtp_user = os.getenv("SMTP_USER")
-    smtp_pass = os.getenv("SMTP_PASS")
-    feedback_to = os.getenv("FEEDBACK_EMAIL", "support@littleoatlearners.com")
+    smtp_host = settings.smtp_host
+    smtp_port = settings.smtp_port
+    smtp_user = settings.smtp_user
+    smtp_pass = settings.smtp_pass
+    feedback_to = settings.feedback_email
     
     if not smtp_user or not smtp_pass:
         print("❌ SMTP credentials not configured")
@@ -1209,6 +3031,7 @@ async def submit_mobile_feedback(
     device: str = Form(...),
     os_name: str = Form(..., alias="os"),
     images: Optional[List[UploadFile]] = File(None),
+    settings: Settings = Depends(get_settings),
 ):
     import uuid
     import shutil
@@ -1219,11 +3042,11 @@ async def submit_mobile_feedback(
     from datetime import datetime, timezone
 
     submission_id = uuid.uuid4().hex[:8]
-    smtp_host = os.getenv("SMTP_HOST", "smtp.gmail.com")
-    smtp_port = int(os.getenv("SMTP_PORT", "587"))
-    smtp_user = os.getenv("SMTP_USER")
-    smtp_pass = os.getenv("SMTP_PASS")
-    recipient = os.getenv("FEEDBACK_EMAIL", "support@littleoatlearners.com")
+    smtp_host = settings.smtp_host
+    smtp_port = settings.smtp_port
+    smtp_user = settings.smtp_user
+    smtp_pass = settings.smtp_pass
+    recipient = settings.feedback_email
 
     if not smtp_user or not smtp_pass:
         print("❌ SMTP credentials not configured for mobile feedback")
@@ -1314,7 +3137,91 @@ async def submit_mobile_feedback(
 
 # ==================== RELEASES ENDPOINT ====================
 
+# The shaped /api/releases payload is kept in memory and in
+# releases_cache.json, and refreshed in the background every
+# RELEASES_REFRESH_SECONDS (default 300) with If-None-Match, so requests never
+# wait on GitHub or spend its unauthenticated quota (60 requests/hour). If
+# GitHub fails or rate-limits us, the last index keeps being served, marked
+# with X-Releases-Stale once it is two refresh intervals old, and the next
+# attempt waits for the rate limit to reset.
+#
+# Each refresh also precomputes the latest release's installer per platform,
+# for the desktop updater's version check and the /latest/{platform}
+# redirects, which cost a few hundred bytes instead of the full listing.
+
 GITHUB_RELEASES_API = "https://api.github.com/repos/Streamline1175/homeschool-releases/releases"
+RELEASES_CACHE_FILE = os.path.join(CACHE_ROOT, "releases_cache.json")
+RATE_LIMIT_MAX_WAIT_SECONDS = 3600
+RELEASE_PLATFORMS = ("mac", "win", "linux")
+# Preferred installer formats per platform, best first
+RELEASE_INSTALLER_PREFERENCE = {
+    "mac": (".dmg", ".pkg", ".zip"),
+    "win": (".exe", ".msi", ".zip"),
+    "linux": (".appimage", ".deb", ".rpm", ".tar.gz"),
+}
+
+_releases_cache: Dict[str, Any] = {
+    "etag": None, "payload": None, "latest": None, "fetched_at": 0.0, "checked_at": 0.0,
+}
+_releases_refresh_task: Optional[asyncio.Task] = None
+
+
+class _ReleasesFetchError(Exception):
+    def __init__(self, status_code: int, retry_after: float = 0.0):
+        super().__init__(f"GitHub returned {status_code}")
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def _rate_limit_wait(r: httpx.Response) -> float:
+    """Seconds until GitHub will take requests again, from a 403/429's
+    Retry-After or X-RateLimit-Reset; 0 if it isn't a rate limit."""
+    retry_after = r.headers.get("retry-after")
+    if retry_after and retry_after.isdigit():
+        return min(float(retry_after), RATE_LIMIT_MAX_WAIT_SECONDS)
+    reset = r.headers.get("x-ratelimit-reset")
+    if r.headers.get("x-ratelimit-remaining") == "0" and reset and reset.isdigit():
+        return min(max(float(reset) - time.time(), 0.0), RATE_LIMIT_MAX_WAIT_SECONDS)
+    return 0.0
+
+
+def _latest_release_index(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """The latest version and, per platform, the URL of its preferred
+    installer."""
+    current = payload.get("current") or {}
+    assets = {}
+    for platform in RELEASE_PLATFORMS:
+        candidates = (current.get("assets") or {}).get(platform) or []
+        preference = RELEASE_INSTALLER_PREFERENCE[platform]
+        ranked = sorted(candidates, key=lambda a: next(
+            (i for i, ext in enumerate(preference) if a["label"].lower().endswith(ext)), len(preference)
+        ))
+        if ranked:
+            assets[platform] = ranked[0]["url"]
+    return {"version": current.get("version", ""), "released": current.get("released", ""), "assets": assets}
+
+
+def load_releases_cache():
+    if not os.path.exists(RELEASES_CACHE_FILE):
+        return
+    try:
+        with open(RELEASES_CACHE_FILE, "r") as f:
+            data = json.load(f)
+        if isinstance(data.get("payload"), dict):
+            _releases_cache.update(data)
+            _releases_cache["latest"] = _latest_release_index(data["payload"])
+            print(f"🚀 Loaded cached releases index from {RELEASES_CACHE_FILE}")
+    except Exception as e:
+        print(f"⚠️ Error reading releases cache: {e}")
+
+
+def save_releases_cache():
+    try:
+        os.makedirs(os.path.dirname(RELEASES_CACHE_FILE), exist_ok=True)
+        _atomic_write_json(RELEASES_CACHE_FILE, _releases_cache, prefix=".releases-")
+    except Exception as e:
+        print(f"⚠️ Error writing releases cache: {e}")
+
 
 def _group_assets_by_os(assets):
     mac, win, linux = [], [], []
@@ -1328,18 +3235,8 @@ def _group_assets_by_os(assets):
             linux.append({"label": a["label"], "size": a["size"], "url": a["url"]})
     return {"mac": mac, "win": win, "linux": linux}
 
-@app.get("/api/releases")
-async def get_releases():
-    async with httpx.AsyncClient(timeout=15.0) as client:
-        r = await client.get(
-            GITHUB_RELEASES_API,
-            headers={"Accept": "application/vnd.github+json"}
-        )
-
-    if r.status_code != 200:
-        return JSONResponse(status_code=r.status_code, content={"error": "Failed to fetch releases from GitHub"})
-
-    data = r.json()
+def _shape_releases(data: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Turn GitHub's releases listing into the /api/releases payload."""
     releases = []
 
     for rel in data:
@@ -1397,6 +3294,116 @@ async def get_releases():
     }
 
 
+async def _fetch_releases() -> bool:
+    """Refresh the releases index from GitHub, conditionally on the ETag of
+    the last listing. Returns True if it changed; raises if GitHub failed."""
+    headers = {"Accept": "application/vnd.github+json"}
+    if _releases_cache["etag"] and _releases_cache["payload"] is not None:
+        headers["If-None-Match"] = _releases_cache["etag"]
+    r = await get_github_http().get(GITHUB_RELEASES_API, headers=headers, timeout=15.0)
+
+    if r.status_code == 304:
+        _releases_cache["checked_at"] = time.time()
+        return False
+    if r.status_code != 200:
+        raise _ReleasesFetchError(r.status_code, _rate_limit_wait(r))
+
+    _releases_cache["payload"] = _shape_releases(r.json())
+    _releases_cache["latest"] = _latest_release_index(_releases_cache["payload"])
+    _releases_cache["etag"] = r.headers.get("etag")
+    _releases_cache["fetched_at"] = _releases_cache["checked_at"] = time.time()
+    await asyncio.to_thread(save_releases_cache)
+    return True
+
+
+async def _refresh_releases() -> bool:
+    # The background loop and a cold-start request share one GitHub call
+    return await _upstream_flights.do(("github", "releases"), _fetch_releases, timeout=20.0)
+
+
+async def _releases_refresh_loop():
+    while True:
+        wait = get_settings().releases_refresh_seconds
+        try:
+            if await _refresh_releases():
+                print(f"🚀 Releases index refreshed: {_releases_cache['payload']['current']['version'] or 'no releases'}")
+        except _ReleasesFetchError as e:
+            print(f"⚠️ Releases refresh failed (GitHub returned {e.status_code}), keeping previous index")
+            wait = max(wait, e.retry_after)
+        except Exception as e:
+            print(f"⚠️ Releases refresh failed, keeping previous index: {e}")
+        await asyncio.sleep(wait)
+
+
+@app.on_event("startup")
+async def _start_releases_refresh():
+    global _releases_refresh_task
+    await asyncio.to_thread(load_releases_cache)
+    _releases_refresh_task = asyncio.create_task(_releases_refresh_loop())
+
+
+@app.on_event("shutdown")
+async def _stop_releases_refresh():
+    if _releases_refresh_task is not None:
+        _releases_refresh_task.cancel()
+
+
+async def _ensure_releases():
+    """None once there is a releases index to serve, else the error response."""
+    if _releases_cache["payload"] is not None:
+        return None
+    # Nothing fetched yet, ever: this request has to wait for GitHub
+    try:
+        await _refresh_releases()
+    except _ReleasesFetchError as e:
+        return JSONResponse(status_code=e.status_code, content={"error": "Failed to fetch releases from GitHub"})
+    except Exception as e:
+        print(f"❌ Releases fetch failed: {e}")
+        return JSONResponse(status_code=502, content={"error": "Failed to fetch releases from GitHub"})
+    return None
+
+
+def _mark_releases_stale(response: Response):
+    age = time.time() - _releases_cache["checked_at"]
+    if age > 2 * get_settings().releases_refresh_seconds:
+        response.headers["X-Releases-Stale"] = "true"
+        response.headers["X-Releases-Age"] = str(int(age))
+
+
+@app.get("/api/releases")
+async def get_releases(response: Response):
+    error = await _ensure_releases()
+    if error is not None:
+        return error
+    _mark_releases_stale(response)
+    return _releases_cache["payload"]
+
+
+@app.get("/api/releases/latest")
+async def get_latest_release(response: Response):
+    """Version check for the desktop updater: the latest version and its
+    installer URL per platform, nothing else."""
+    error = await _ensure_releases()
+    if error is not None:
+        return error
+    _mark_releases_stale(response)
+    return _releases_cache["latest"]
+
+
+@app.get("/api/releases/latest/{platform}")
+async def download_latest_release(platform: str):
+    """Redirect to the latest release's installer for mac, win or linux."""
+    if platform not in RELEASE_PLATFORMS:
+        return JSONResponse(status_code=404, content={"error": f"Unknown platform: {platform}"})
+    error = await _ensure_releases()
+    if error is not None:
+        return error
+    url = _releases_cache["latest"]["assets"].get(platform)
+    if not url:
+        return JSONResponse(status_code=404, content={"error": f"No {platform} installer in the latest release"})
+    return RedirectResponse(url, status_code=302)
+
+
 # ============================================================================
 # ADMIN KEY VALIDATION + CONTENT PROXY (added 2026-07-25)
 # ============================================================================
@@ -1405,8 +3412,13 @@ async def get_releases():
 #   GITHUB_CONTENT_TOKEN  fine-grained PAT with read access to the content repo
 #   CONTENT_REPO          owner/repo (default Streamline1175/homeschool-content)
 #   CONTENT_BRANCH        branch (default main)
+#   CONTENT_CACHE_MAX_MB         disk budget for cached content files (default 512)
+#   CONTENT_CACHE_FRESH_SECONDS  serve a cached file without asking GitHub for
+#                                this long after it was last checked (default 60)
+#   CONTENT_MIRROR_SYNC_SECONDS  interval between content mirror syncs (default 300)
+#   CONTENT_NEGATIVE_CACHE_TTL_SECONDS  remember a path GitHub 404'd for this
+#                                       long (default 60)
 
-import hmac as _hmac
 from urllib.parse import quote as _urlquote
 from fastapi.responses import Response as _RawResponse
 
@@ -1417,71 +3429,634 @@ class AdminKeyRequest(BaseModel):
 
 
 @app.post("/api/validate-admin-key")
-async def validate_admin_key(request: AdminKeyRequest):
+async def validate_admin_key(request: AdminKeyRequest, settings: Settings = Depends(get_settings)):
     """Validate an admin license key against the server-side ADMIN_KEYS list.
 
     The desktop app calls this for admin-format keys so no key material has
-    to ship inside the public binaries. Comparison is constant-time and the
-    key is never echoed back or fully logged.
+    to ship inside the public binaries. Keys are compared as SHA-256 digests
+    (pre-hashed at settings load), so lookup timing reveals nothing about the
+    keys themselves, and the key is never echoed back or fully logged.
     """
-    admin_keys = [k.strip().upper() for k in os.getenv("ADMIN_KEYS", "").split(",") if k.strip()]
     supplied = (request.key or "").strip().upper()
 
-    valid = any(_hmac.compare_digest(supplied, k) for k in admin_keys)
+    valid = bool(supplied) and _hash_admin_key(supplied) in settings.admin_key_hashes
     print(f"🔐 Admin key check: {supplied[:6]}*** -> {'VALID' if valid else 'invalid'} (device: {(request.device_id or 'unknown')[:8]})")
 
     return {"valid": valid}
 
 
-def _content_repo_config():
+def _content_repo_config(settings: Settings):
+    return {
+        "repo": settings.content_repo,
+        "branch": settings.content_branch,
+        "token": settings.github_content_token,
+    }
+
+
+# Shared connection pool for GitHub API calls.
+_github_http: Optional[httpx.AsyncClient] = None
+
+
+def get_github_http() -> httpx.AsyncClient:
+    global _github_http
+    if _github_http is None or _github_http.is_closed:
+        _github_http = httpx.AsyncClient(
+            follow_redirects=True,
+            timeout=60.0,
+            limits=httpx.Limits(max_connections=10, max_keepalive_connections=5),
+        )
+    return _github_http
+
+
+@app.on_event("shutdown")
+async def _close_github_http():
+    if _github_http is not None:
+        await _github_http.aclose()
+
+
+# Content files cached on disk, keyed by (repo, branch, path), with the ETag
+# GitHub sent for each. Within CONTENT_CACHE_FRESH_SECONDS of the last check a
+# hit is served straight from disk; after that the file is revalidated with
+# If-None-Match, and GitHub's 304 (which doesn't count against the rate
+# limit) renews it. If GitHub errors or rate-limits us, the cached copy is
+# served anyway. ETags and media types are kept in content_index.json so
+# revalidation survives restarts.
+#
+# A miss is fetched into the cache by a background _CacheFill, at GitHub's
+# pace rather than the first client's, and every request for the file while
+# it runs (the first included) streams the fill as it grows. Memory stays
+# flat whatever the file size, and GitHub is asked once.
+CONTENT_INDEX_FILE = os.path.join(CACHE_ROOT, "content_index.json")
+
+_content_cache = DiskCache(
+    os.path.join(CACHE_ROOT, "content"),
+    max_bytes=lambda: get_settings().content_cache_max_mb * 1024 * 1024,
+)
+_content_index: Dict[str, Dict[str, Any]] = {}  # name -> {"etag", "media_type", "path"}
+_content_checked: Dict[str, float] = {}  # name -> monotonic time GitHub last confirmed it
+_content_fetches: Dict[str, _CacheFill] = {}  # name -> its in-progress fetch
+# name -> resolved with the _CacheFill (or None) once GitHub's headers arrive
+_content_pending: Dict[str, asyncio.Future] = {}
+_content_missing = TTLCache(max_entries=10000)  # names GitHub recently answered 404 for
+_content_index_loaded = False
+
+
+def _valid_content_path(path: str) -> bool:
+    """Repo-relative paths only: no empty, no absolute, no traversal, no
+    backslashes."""
+    return not (not path or path.startswith("/") or "\\" in path
+                or any(p in ("", ".", "..") for p in path.split("/")))
+
+
+def _content_file_url(cfg: Dict[str, Any], path: str) -> str:
+    encoded_path = "/".join(_urlquote(p) for p in path.split("/"))
+    return f"https://api.github.com/repos/{cfg['repo']}/contents/{encoded_path}?ref={cfg['branch']}"
+
+
+def _content_cache_name(cfg: Dict[str, Any], path: str) -> str:
+    return hashlib.sha256(f"{cfg['repo']}\0{cfg['branch']}\0{path}".encode()).hexdigest()
+
+
+def _load_content_index():
+    global _content_index_loaded
+    if _content_index_loaded:
+        return
+    _content_index_loaded = True
+    try:
+        with open(CONTENT_INDEX_FILE, "r") as f:
+            _content_index.update(json.load(f))
+    except (OSError, ValueError):
+        pass
+
+
+def _save_content_index():
+    _atomic_write_json(CONTENT_INDEX_FILE, _content_index, prefix=".content-index-")
+
+
+def _serve_cached_content(name: str, media_type: str):
+    """Pinned FileResponse for a cached content file, or None if it's gone.
+    FileResponse answers Range requests from disk by itself."""
+    cached = _content_cache.acquire(name)
+    if cached is None:
+        return None
+    return _PinnedFileResponse(cached, cache=_content_cache, name=name, media_type=media_type)
+
+
+def _content_is_fresh(name: str, settings: Settings) -> bool:
+    return (name in _content_index
+            and time.monotonic() - _content_checked.get(name, float("-inf")) < settings.content_cache_fresh_seconds)
+
+
+async def _fetch_content(url: str, headers: Dict[str, str], path: str, name: str,
+                         range_header: Optional[str]):
+    """Fetch a content file from GitHub and stream it to the client. A full
+    200 body is fetched into the cache in the background and streamed from
+    there.
+
+    Returns (response, status): response is None when the caller should
+    fall back to the cache or an error, with status saying why.
+    """
+    request_headers = dict(headers)
+    # The cache needs the file's bytes exactly, not a compressed transfer
+    request_headers["Accept-Encoding"] = "identity"
+    meta = _content_index.get(name)
+    if range_header:
+        request_headers["Range"] = range_header
+    elif meta and meta.get("etag") and _content_cache.get(name):
+        request_headers["If-None-Match"] = meta["etag"]
+
+    # Full-file requests for the same name arriving before the headers do
+    # wait for them here, then follow the same fill
+    pending = None
+    if not range_header and name not in _content_pending:
+        pending = asyncio.get_running_loop().create_future()
+        _content_pending[name] = pending
+    try:
+        response, status_code = await _send_content_request(url, request_headers, path, name, range_header)
+    finally:
+        if pending is not None:
+            del _content_pending[name]
+            pending.set_result(_content_fetches.get(name))
+    return response, status_code
+
+
+async def _send_content_request(url: str, request_headers: Dict[str, str], path: str, name: str,
+                                range_header: Optional[str]):
+    client = get_github_http()
+    try:
+        upstream = await client.send(client.build_request("GET", url, headers=request_headers), stream=True)
+    except Exception as e:
+        print(f"❌ /api/content/file: upstream error for {path}: {e}")
+        return None, 502
+
+    status_code = upstream.status_code
+    if status_code not in (200, 206):
+        await upstream.aclose()
+        if status_code == 304:
+            _content_checked[name] = time.monotonic()
+        elif status_code == 404:
+            _content_missing.set(name, True, get_settings().content_negative_cache_ttl_seconds)
+            if _content_index.pop(name, None) is not None:
+                await asyncio.to_thread(_save_content_index)
+        return None, status_code
+
+    media_type = upstream.headers.get("content-type", "application/octet-stream")
+    response_headers = {"Accept-Ranges": "bytes"}
+    for header in ("content-length", "content-range"):
+        if header in upstream.headers:
+            response_headers[header.title()] = upstream.headers[header]
+
+    async def body():
+        try:
+            async for chunk in upstream.aiter_raw(DOWNLOAD_CHUNK_SIZE):
+                yield chunk
+        finally:
+            await upstream.aclose()
+
+    if (status_code == 200 and "content-encoding" not in upstream.headers
+            and name not in _content_cache.filling):
+        length = upstream.headers.get("content-length")
+        meta = {"etag": upstream.headers.get("etag"), "media_type": media_type, "path": path}
+
+        async def on_publish():
+            # The ETag is only recorded once the file itself is in the cache
+            _content_index[name] = meta
+            _content_checked[name] = time.monotonic()
+            await asyncio.to_thread(_save_content_index)
+
+        fill = _CacheFill(_content_cache, name, body(), _content_fetches,
+                          expected_size=int(length) if length and length.isdigit() else None,
+                          on_publish=on_publish, media_type=media_type, headers=response_headers)
+        return _follow_content_fill(fill), status_code
+    return StreamingResponse(body(), status_code=status_code, media_type=media_type,
+                             headers=response_headers), status_code
+
+
+def _follow_content_fill(fill: _CacheFill) -> StreamingResponse:
+    return StreamingResponse(fill.open(DOWNLOAD_CHUNK_SIZE), media_type=fill.media_type, headers=fill.headers)
+
+
+# Local mirror of CONTENT_REPO@CONTENT_BRANCH. Every CONTENT_MIRROR_SYNC_SECONDS
+# the branch's tree is listed through the git trees API, conditionally, so an
+# unchanged branch costs one 304 and no rate limit, and only blobs whose SHA
+# isn't on disk yet are downloaded. Blobs are stored by SHA, so a renamed or
+# reverted file is never fetched twice. Mirrored paths are served straight
+# from disk; paths the mirror doesn't have yet (before the first sync, or a
+# blob that failed to download) still go through the proxy above.
+# /api/content/manifest lists path -> blob SHA and size, so clients can diff
+# against what they have and fetch only what changed.
+#
+# While the manifest is current (confirmed by a sync within the last two
+# sync intervals), it is also the list of valid paths: anything not in it is
+# answered 404 locally, without asking GitHub. A path added upstream is
+# found by the next sync.
+import mimetypes
+
+CONTENT_MIRROR_DIR = os.path.join(CACHE_ROOT, "content_mirror")
+CONTENT_MANIFEST_FILE = os.path.join(CONTENT_MIRROR_DIR, "manifest.json")
+CONTENT_MIRROR_FETCH_CONCURRENCY = 4
+
+_content_manifest: Optional[Dict[str, Any]] = None  # {"repo", "branch", "tree", "etag", "syncedAt", "files"}
+_content_manifest_loaded = False
+_content_manifest_checked = float("-inf")  # monotonic time a sync last confirmed the manifest
+_content_mirror_task: Optional[asyncio.Task] = None
+
+
+def _content_api_headers(cfg: Dict[str, Any], accept: str) -> Dict[str, str]:
     return {
-        "repo": os.getenv("CONTENT_REPO", "Streamline1175/homeschool-content"),
-        "branch": os.getenv("CONTENT_BRANCH", "main"),
-        "token": os.getenv("GITHUB_CONTENT_TOKEN", ""),
+        "Authorization": f"Bearer {cfg['token']}",
+        "Accept": accept,
+        "User-Agent": "LittleOatLearners-Backend",
+    }
+
+
+def _mirror_blob_path(sha: str) -> str:
+    return os.path.join(CONTENT_MIRROR_DIR, "blobs", sha[:2], sha)
+
+
+def _load_content_manifest() -> Optional[Dict[str, Any]]:
+    global _content_manifest, _content_manifest_loaded
+    if not _content_manifest_loaded:
+        _content_manifest_loaded = True
+        try:
+            with open(CONTENT_MANIFEST_FILE, "r") as f:
+                _content_manifest = json.load(f)
+        except (OSError, ValueError):
+            pass
+    return _content_manifest
+
+
+def _current_content_manifest(cfg: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """The mirror's manifest, if it is of the configured repo and branch."""
+    manifest = _load_content_manifest()
+    if manifest and manifest.get("repo") == cfg["repo"] and manifest.get("branch") == cfg["branch"]:
+        return manifest
+    return None
+
+
+def _content_path_exists(cfg: Dict[str, Any], path: str) -> Optional[bool]:
+    """Whether the repo has ``path``, by the mirror's manifest, or None if
+    the manifest is missing or hasn't been confirmed recently enough to say."""
+    manifest = _current_content_manifest(cfg)
+    max_age = 2 * get_settings().content_mirror_sync_seconds
+    if manifest is None or time.monotonic() - _content_manifest_checked > max_age:
+        return None
+    return path in manifest["files"]
+
+
+def _content_known_missing(cfg: Dict[str, Any], path: str) -> bool:
+    """True if ``path`` can be answered 404 without asking GitHub."""
+    return (_content_path_exists(cfg, path) is False
+            or _content_missing.get(_content_cache_name(cfg, path)) is not None)
+
+
+async def _walk_content_tree(cfg: Dict[str, Any], sha: str, prefix: str = "") -> List[Dict[str, Any]]:
+    """List a tree one directory per request, for trees too big for a
+    single recursive listing."""
+    client = get_github_http()
+    resp = await client.get(f"https://api.github.com/repos/{cfg['repo']}/git/trees/{sha}",
+                            headers=_content_api_headers(cfg, "application/vnd.github+json"))
+    resp.raise_for_status()
+    entries = []
+    for entry in resp.json().get("tree", []):
+        path = prefix + entry["path"]
+        if entry.get("type") == "tree":
+            entries += await _walk_content_tree(cfg, entry["sha"], path + "/")
+        else:
+            entries.append(dict(entry, path=path))
+    return entries
+
+
+async def _fetch_content_tree(cfg: Dict[str, Any], etag: Optional[str]):
+    """(tree SHA, entries, ETag) for the branch, or None if it hasn't
+    changed since ``etag``."""
+    headers = _content_api_headers(cfg, "application/vnd.github+json")
+    if etag:
+        headers["If-None-Match"] = etag
+    client = get_github_http()
+    resp = await client.get(
+        f"https://api.github.com/repos/{cfg['repo']}/git/trees/{_urlquote(cfg['branch'], safe='/')}",
+        params={"recursive": "1"}, headers=headers,
+    )
+    if resp.status_code == 304:
+        return None
+    resp.raise_for_status()
+    data = resp.json()
+    entries = data.get("tree", [])
+    if data.get("truncated"):
+        entries = await _walk_content_tree(cfg, data["sha"])
+    return data["sha"], entries, resp.headers.get("etag")
+
+
+async def _fetch_content_blob(cfg: Dict[str, Any], sha: str, size: int):
+    """Download one blob into the mirror, checking it against its SHA."""
+    path = _mirror_blob_path(sha)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".fill-", suffix=".tmp")
+    # A git blob's SHA is the SHA-1 of "blob <size>\0" followed by its bytes
+    digest = hashlib.sha1(f"blob {size}\0".encode())
+    client = get_github_http()
+    try:
+        with os.fdopen(fd, "wb") as f:
+            async with client.stream("GET", f"https://api.github.com/repos/{cfg['repo']}/git/blobs/{sha}",
+                                     headers=_content_api_headers(cfg, "application/vnd.github.raw")) as resp:
+                resp.raise_for_status()
+                async for chunk in resp.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                    digest.update(chunk)
+                    f.write(chunk)
+        if digest.hexdigest() != sha:
+            raise ValueError("content does not match its blob SHA")
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _prune_content_mirror(*manifests):
+    """Delete blobs none of ``manifests`` refer to. Blocking."""
+    keep = {f["sha"] for m in manifests if m for f in m["files"].values()}
+    for root, _, names in os.walk(os.path.join(CONTENT_MIRROR_DIR, "blobs")):
+        for name in names:
+            if name not in keep:
+                try:
+                    os.unlink(os.path.join(root, name))
+                except OSError:
+                    pass
+
+
+async def sync_content_mirror(cfg: Dict[str, Any]) -> Optional[int]:
+    """Bring the mirror up to date with the branch. Returns the number of
+    blobs downloaded, or None if the branch hasn't changed."""
+    global _content_manifest, _content_manifest_checked
+    previous = _current_content_manifest(cfg)
+    tree = await _fetch_content_tree(cfg, previous.get("etag") if previous else None)
+    if tree is None:
+        _content_manifest_checked = time.monotonic()
+        return None
+    tree_sha, entries, etag = tree
+    files = {
+        e["path"]: {"sha": e["sha"], "size": e.get("size", 0)}
+        for e in entries if e.get("type") == "blob"
+    }
+    missing = {f["sha"]: f["size"] for f in files.values() if not os.path.exists(_mirror_blob_path(f["sha"]))}
+
+    semaphore = asyncio.Semaphore(CONTENT_MIRROR_FETCH_CONCURRENCY)
+
+    async def fetch(sha: str, size: int) -> bool:
+        async with semaphore:
+            try:
+                await _fetch_content_blob(cfg, sha, size)
+                return True
+            except Exception as e:
+                print(f"⚠️ Content mirror: blob {sha[:12]} failed: {e}")
+                return False
+
+    results = await asyncio.gather(*[fetch(sha, size) for sha, size in missing.items()])
+    fetched = sum(results)
+    manifest = {
+        "repo": cfg["repo"],
+        "branch": cfg["branch"],
+        "tree": tree_sha,
+        # Without an ETag the next sync lists the tree again and retries any
+        # blob that failed; until then those paths go through the proxy
+        "etag": etag if fetched == len(missing) else None,
+        "syncedAt": time.time(),
+        "files": files,
     }
+    os.makedirs(CONTENT_MIRROR_DIR, exist_ok=True)
+    await asyncio.to_thread(_atomic_write_json, CONTENT_MANIFEST_FILE, manifest, ".content-manifest-")
+    old = _content_manifest
+    _content_manifest = manifest
+    _content_manifest_checked = time.monotonic()
+    # Paths GitHub 404'd may exist now
+    _content_missing.clear()
+    # The previous manifest's blobs survive one more sync, so responses
+    # that are still streaming them can finish
+    await asyncio.to_thread(_prune_content_mirror, manifest, old)
+    return fetched
+
+
+def _serve_mirrored_content(cfg: Dict[str, Any], path: str):
+    """FileResponse for a path from the local mirror, or None if it isn't
+    mirrored (yet). FileResponse answers Range requests from disk."""
+    manifest = _current_content_manifest(cfg)
+    entry = manifest["files"].get(path) if manifest else None
+    if entry is None:
+        return None
+    blob = _mirror_blob_path(entry["sha"])
+    if not os.path.exists(blob):
+        return None
+    media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    return FileResponse(blob, media_type=media_type, headers={"ETag": f'"{entry["sha"]}"'})
+
+
+async def _content_mirror_loop():
+    while True:
+        cfg = _content_repo_config(get_settings())
+        if cfg["token"]:
+            try:
+                fetched = await sync_content_mirror(cfg)
+                if fetched is not None:
+                    print(f"📚 Content mirror synced: {len(_content_manifest['files'])} file(s), "
+                          f"{fetched} blob(s) downloaded")
+            except Exception as e:
+                print(f"⚠️ Content mirror sync failed, keeping previous copy: {e}")
+        await asyncio.sleep(get_settings().content_mirror_sync_seconds)
+
+
+@app.on_event("startup")
+async def _start_content_mirror():
+    global _content_mirror_task
+    _content_mirror_task = asyncio.create_task(_content_mirror_loop())
+
+
+@app.on_event("shutdown")
+async def _stop_content_mirror():
+    if _content_mirror_task is not None:
+        _content_mirror_task.cancel()
+
+
+@app.get("/api/content/manifest")
+async def get_content_manifest(request: Request, settings: Settings = Depends(get_settings)):
+    """Every path in the content repo with its git blob SHA and size.
+
+    The ETag is the tree SHA, so an unchanged repo answers If-None-Match
+    with an empty 304.
+    """
+    cfg = _content_repo_config(settings)
+    if not cfg["token"]:
+        return JSONResponse(status_code=503, content={"error": "Content service not configured"})
+    manifest = _current_content_manifest(cfg)
+    if manifest is None:
+        return JSONResponse(status_code=503, content={"error": "Content mirror not synced yet"})
+
+    etag = f'"{manifest["tree"]}"'
+    if request.headers.get("if-none-match") == etag:
+        return _RawResponse(status_code=304, headers={"ETag": etag})
+    return JSONResponse(
+        content={"branch": manifest["branch"], "tree": manifest["tree"], "files": manifest["files"]},
+        headers={"ETag": etag},
+    )
 
 
 @app.get("/api/content/file")
-async def get_content_file(path: str = ""):
-    """Proxy a file from the private content repo to the desktop app.
+async def get_content_file(request: Request, path: str = "", settings: Settings = Depends(get_settings)):
+    """Serve a file from the private content repo to the desktop app, from
+    the local mirror if it has the path and through the proxy otherwise.
 
     The GitHub token lives only on this server, never in shipped binaries.
     Path is validated against traversal; only repo-relative paths allowed.
+    Range requests are honoured, from the cache or by forwarding them.
     """
-    # Path validation: no empty, no absolute, no traversal, no backslashes
-    parts = path.split("/")
-    if (not path or path.startswith("/") or "\\" in path
-            or any(p in ("", ".", "..") for p in parts)):
+    if not _valid_content_path(path):
         return JSONResponse(status_code=400, content={"error": "Invalid path"})
 
-    cfg = _content_repo_config()
+    cfg = _content_repo_config(settings)
     if not cfg["token"]:
         print("❌ /api/content/file: GITHUB_CONTENT_TOKEN not set")
         return JSONResponse(status_code=503, content={"error": "Content service not configured"})
 
-    encoded_path = "/".join(_urlquote(p) for p in parts)
-    url = f"https://api.github.com/repos/{cfg['repo']}/contents/{encoded_path}?ref={cfg['branch']}"
-    headers = {
-        "Authorization": f"Bearer {cfg['token']}",
-        "Accept": "application/vnd.github.v3.raw",
-        "User-Agent": "LittleOatLearners-Backend",
-    }
-
-    try:
-        async with httpx.AsyncClient(follow_redirects=True, timeout=60.0) as client:
-            r = await client.get(url, headers=headers)
-    except Exception as e:
-        print(f"❌ /api/content/file: upstream error for {path}: {e}")
-        return JSONResponse(status_code=502, content={"error": "Upstream fetch failed"})
+    response = _serve_mirrored_content(cfg, path)
+    if response is not None:
+        return response
+    if _content_known_missing(cfg, path):
+        return JSONResponse(status_code=404, content={"error": f"File not found: {path}"})
 
-    if r.status_code == 404:
+    _load_content_index()
+    name = _content_cache_name(cfg, path)
+
+    # Identical paths requested at the same time (e.g. many app launches after
+    # a content update) share one GitHub fetch, each following it as it fills
+    range_header = request.headers.get("range")
+    pending = _content_pending.get(name)
+    if pending is not None and not range_header:
+        await asyncio.shield(pending)
+    fill = _content_fetches.get(name)
+    if fill is not None and not range_header:
+        return _follow_content_fill(fill)
+    if _content_is_fresh(name, settings):
+        response = _serve_cached_content(name, _content_index[name]["media_type"])
+        if response is not None:
+            return response
+
+    url = _content_file_url(cfg, path)
+    headers = _content_api_headers(cfg, "application/vnd.github.v3.raw")
+
+    # A ranged read of an uncached or filling file is forwarded as-is. A
+    # cached one is revalidated in full: a 304 is then served from disk,
+    # range and all, and a changed file comes back whole (which Range
+    # allows) as it refills.
+    forward_range = range_header if name not in _content_index or fill is not None else None
+    response, status_code = await _fetch_content(url, headers, path, name, forward_range)
+    if response is not None:
+        return response
+
+    if status_code == 404:
         return JSONResponse(status_code=404, content={"error": f"File not found: {path}"})
-    if r.status_code != 200:
-        print(f"❌ /api/content/file: GitHub returned {r.status_code} for {path}")
-        return JSONResponse(status_code=502, content={"error": f"Upstream returned {r.status_code}"})
+    # 304, or GitHub is failing or rate-limiting us: a stale copy beats an error
+    meta = _content_index.get(name)
+    if meta:
+        response = _serve_cached_content(name, meta["media_type"])
+        if response is not None:
+            if status_code != 304:
+                print(f"⚠️ /api/content/file: GitHub returned {status_code} for {path}, serving cached copy")
+            return response
+    print(f"❌ /api/content/file: GitHub returned {status_code} for {path}")
+    return JSONResponse(status_code=502, content={"error": f"Upstream returned {status_code}"})
+
+
+# Many content files as one streamed ZIP, built by _stream_zip: mirrored
+# files are read from disk and the rest fetched from GitHub, a few at a
+# time. A bundle made up entirely of mirrored files goes through the bundle
+# cache, keyed by its paths and blob SHAs, so the first-run download every
+# new install asks for is zipped once per content update.
+CONTENT_BUNDLE_MAX_FILES = 5000
+
+
+class ContentBundleRequest(BaseModel):
+    paths: List[str] = []
+    prefix: Optional[str] = None  # A directory ("" for the whole repo), listed from the manifest
+
+
+async def _iter_content_upstream(cfg: Dict[str, Any], path: str):
+    client = get_github_http()
+    async with client.stream("GET", _content_file_url(cfg, path),
+                             headers=_content_api_headers(cfg, "application/vnd.github.v3.raw")) as resp:
+        if resp.status_code == 404:
+            _content_missing.set(_content_cache_name(cfg, path), True,
+                                 get_settings().content_negative_cache_ttl_seconds)
+        if resp.status_code != 200:
+            raise RuntimeError(f"GitHub returned {resp.status_code}")
+        async for chunk in resp.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+            yield chunk
+
+
+@app.post("/api/content/bundle")
+async def get_content_bundle(request: ContentBundleRequest, settings: Settings = Depends(get_settings)):
+    """Stream several content files back as one ZIP.
+
+    Paths are validated like /api/content/file. A prefix needs the mirror's
+    manifest to list it. Files that can't be fetched are left out of the
+    archive rather than failing the whole download.
+    """
+    cfg = _content_repo_config(settings)
+    if not cfg["token"]:
+        print("❌ /api/content/bundle: GITHUB_CONTENT_TOKEN not set")
+        return JSONResponse(status_code=503, content={"error": "Content service not configured"})
+
+    paths = list(dict.fromkeys(request.paths))
+    invalid = next((p for p in paths if not _valid_content_path(p)), None)
+    if invalid is not None:
+        return JSONResponse(status_code=400, content={"error": f"Invalid path: {invalid}"})
+
+    manifest = _current_content_manifest(cfg)
+    if request.prefix is not None:
+        prefix = request.prefix.strip("/")
+        if prefix and not _valid_content_path(prefix):
+            return JSONResponse(status_code=400, content={"error": "Invalid prefix"})
+        if manifest is None:
+            return JSONResponse(status_code=503, content={"error": "Content mirror not synced yet"})
+        listed = set(paths)
+        under = prefix + "/" if prefix else ""
+        paths += sorted(p for p in manifest["files"] if p.startswith(under) and p not in listed)
+        if not paths:
+            return JSONResponse(status_code=404, content={"error": f"No files under {prefix or 'the repo root'}"})
+    if not paths:
+        return JSONResponse(status_code=400, content={"error": "No paths given"})
+    missing = {p for p in paths if _content_known_missing(cfg, p)}
+    if missing:
+        print(f"   ❌ /api/content/bundle: leaving out {len(missing)} unknown path(s), e.g. {min(missing)}")
+        paths = [p for p in paths if p not in missing]
+        if not paths:
+            return JSONResponse(status_code=404, content={"error": f"File not found: {min(missing)}"})
+    if len(paths) > CONTENT_BUNDLE_MAX_FILES:
+        return JSONResponse(status_code=400, content={
+            "error": f"Too many files ({len(paths)}), at most {CONTENT_BUNDLE_MAX_FILES} per bundle"
+        })
 
-    media_type = r.headers.get("content-type", "application/octet-stream")
-    return _RawResponse(content=r.content, media_type=media_type)
+    files = manifest["files"] if manifest else {}
+    entries = []
+    key_parts: Optional[List[str]] = []
+    for path in paths:
+        entry = files.get(path)
+        blob = _mirror_blob_path(entry["sha"]) if entry else None
+        if blob and os.path.exists(blob):
+            open_file = lambda blob=blob: _iter_local_file(blob, DOWNLOAD_CHUNK_SIZE)
+            if key_parts is not None:
+                key_parts.append(f"{path}\0{entry['sha']}")
+        else:
+            open_file = lambda path=path: _iter_content_upstream(cfg, path)
+            key_parts = None
+        entries.append({"name": path, "size": entry["size"] if entry else None, "open": open_file})
+
+    bundle_key = None
+    if key_parts is not None:
+        bundle_key = hashlib.sha256(("content\n" + "\n".join(key_parts)).encode()).hexdigest()
+    print(f"📦 /api/content/bundle: {len(entries)} file(s), {'cacheable' if bundle_key else 'not all mirrored'}")
+    return await _serve_zip("content.zip", bundle_key, entries)
 
 
 if __name__ == "__main__":